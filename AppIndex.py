@@ -0,0 +1,198 @@
+"""程序启动器的快捷方式索引
+
+python AppIndex.py 可运行微基准,对比线性子串扫描与索引查询
+"""
+import os
+import time
+import random
+import threading
+import unicodedata
+from heapq import nlargest
+from itertools import chain
+from collections import Counter, defaultdict
+from IntentRouter import to_pinyin
+
+# 作为程序入口的文件类型
+suffixes = (".lnk", ".url", ".exe", ".appref-ms")
+
+# 快捷方式名中常见的无用后缀,不参与匹配也不发给LLM
+noise = (" - 快捷方式", " - shortcut", " shortcut", " 快捷方式")
+
+
+def display_name(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    for suffix in noise:
+        if name.lower().endswith(suffix):
+            name = name[: -len(suffix)]
+    return name.strip()
+
+
+def normalize(text):
+    """全角转半角,统一小写,去除空白和标点"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in "PS")
+
+
+def keys_of(text):
+    """名称的检索键:原文,拼音,拼音或单词首字母(同音字和缩写都能命中)"""
+    name = normalize(text)
+    keys = {name}
+    words = text.lower().split()
+    if len(words) > 1:
+        keys.add("".join(normalize(word)[:1] for word in words))
+    if any(ord(ch) > 127 for ch in name):
+        syllables = to_pinyin(name).split()
+        keys.add("".join(syllables))
+        keys.add("".join(s[0] for s in syllables if s))
+    return [key for key in keys if key]
+
+
+def trigrams(key):
+    padded = f"^{key}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def key_score(query, key, query_grams, key_grams):
+    if query == key:
+        return 1.0
+    if key.startswith(query):
+        return 0.9 + 0.05 * len(query) / len(key)
+    if query in key:
+        return 0.8 + 0.05 * len(query) / len(key)
+    return 0.75 * 2 * len(query_grams & key_grams) / (len(query_grams) + len(key_grams))
+
+
+class Entry:
+    def __init__(self, path, priority=0):
+        self.path = path
+        self.name = display_name(path)
+        self.priority = priority  # 来源优先级,桌面高于开始菜单
+        self.keys = [(key, trigrams(key)) for key in keys_of(self.name)]
+
+
+class AppIndex:
+    """快捷方式名称的三元组+拼音倒排索引,支持增量增删"""
+
+    def __init__(self):
+        self.entries = {}  # 路径 -> Entry
+        self.postings = defaultdict(set)  # 三元组 -> {路径}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, path, priority=0):
+        entry = Entry(path, priority)
+        with self.lock:
+            self.discard(path)
+            self.entries[path] = entry
+            for _, grams in entry.keys:
+                for gram in grams:
+                    self.postings[gram].add(path)
+
+    def remove(self, path):
+        with self.lock:
+            self.discard(path)
+
+    def discard(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return
+        for _, grams in entry.keys:
+            for gram in grams:
+                paths = self.postings.get(gram)
+                if paths is not None:
+                    paths.discard(path)
+                    if not paths:
+                        del self.postings[gram]
+
+    def scan(self, directory, priority=0, recursive=True):
+        """把目录中的快捷方式加入索引,返回新增数量"""
+        count = 0
+        for root, dirs, files in os.walk(directory):
+            for file in files:
+                if file.lower().endswith(suffixes):
+                    self.add(os.path.join(root, file), priority)
+                    count += 1
+            if not recursive:
+                break
+        return count
+
+    def search(self, query, limit=5, candidates=10):
+        """返回按得分排序的[(得分, Entry)]"""
+        query_keys = [(key, trigrams(key)) for key in keys_of(query)]
+        if not query_keys:
+            return []
+        grams = set().union(*(grams for _, grams in query_keys))
+        with self.lock:
+            counts = Counter(chain.from_iterable(self.postings.get(gram, ()) for gram in grams))
+            # 只对共享三元组最多的候选精确打分
+            top = nlargest(candidates, counts, key=counts.get)
+            results = []
+            for path in top:
+                entry = self.entries[path]
+                score = max(
+                    key_score(qkey, ekey, qgrams, egrams)
+                    for qkey, qgrams in query_keys
+                    for ekey, egrams in entry.keys
+                )
+                results.append((score, entry.priority, entry))
+        results.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return [(score, entry) for score, _, entry in results[:limit]]
+
+    def names(self, limit=None):
+        """去重后的程序名称,优先级高的在前,用于提示词"""
+        with self.lock:
+            entries = sorted(self.entries.values(), key=lambda e: (-e.priority, e.name.lower()))
+        names = dict.fromkeys(
+            e.name for e in entries
+            if "uninstall" not in e.name.lower() and "卸载" not in e.name
+        )
+        return list(names)[:limit]
+
+
+def benchmark(count=5000, queries=200):
+    """对比逐条打分的线性扫描和索引查询的耗时"""
+    random.seed(0)
+    # 从常用汉字区随机取字,模拟数千个互不相同的程序名
+    chars = [chr(random.randint(0x4E00, 0x62FF)) for _ in range(300)]
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    names = []
+    for i in range(count):
+        if i % 2:
+            name = "".join(random.sample(chars, random.randint(2, 5)))
+        else:
+            name = " ".join("".join(random.sample(letters, random.randint(3, 7))) for _ in range(2))
+        names.append(f"{name} {i}")
+    index = AppIndex()
+    stime = time.perf_counter()
+    for name in names:
+        index.add(f"C:\\Apps\\{name}.lnk")
+    build = time.perf_counter() - stime
+    samples = [random.choice(names).rsplit(" ", 1)[0] for _ in range(queries)]
+
+    def linear(query):
+        query_keys = [(key, trigrams(key)) for key in keys_of(query)]
+        return max(
+            (key_score(qkey, ekey, qgrams, egrams), entry.name)
+            for entry in index.entries.values()
+            for qkey, qgrams in query_keys
+            for ekey, egrams in entry.keys
+        )
+
+    for label, func in (("线性扫描", linear), ("索引查询", index.search)):
+        costs = []
+        for query in samples[: queries // 10 if func is linear else queries]:
+            stime = time.perf_counter()
+            func(query)
+            costs.append(time.perf_counter() - stime)
+        costs.sort()
+        print(
+            f"{label:>6}: {count}个条目,平均{sum(costs) / len(costs) * 1e6:.0f}us,"
+            f"p99 {costs[int(len(costs) * 0.99)] * 1e6:.0f}us"
+        )
+    print(f"建立索引耗时{build * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,121 @@
+"""预分配的录音环形缓冲区
+
+python AudioBuffer.py 可运行微基准,对比逐块复制+拼接的旧做法
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+
+class RingBuffer:
+    """固定容量的int16环形缓冲区
+
+    数据区分配两倍容量,每个样本同时写入i和i+capacity两处,
+    因此任意不超过capacity的区间在内存中都是连续的,读取时无需复制.
+    单写多读:写入完成后才推进write_pos,读者可以在录音过程中安全读取.
+    """
+
+    def __init__(self, max_seconds=60, sample_rate=16000, channels=1):
+        self.capacity = int(max_seconds * sample_rate)
+        self.sample_rate = sample_rate
+        self.data = np.zeros((self.capacity * 2, channels), dtype=np.int16)
+        self.write_pos = 0  # 累计写入的样本数
+        self.start_pos = 0  # 当前录音的起点
+
+    def reset(self, preroll=0):
+        """从当前位置开始新的录音,preroll为向前保留的样本数"""
+        self.start_pos = max(self.write_pos - preroll, 0)
+
+    def write(self, indata):
+        """在音频回调中调用,只做原地复制,不分配新的数据区"""
+        n = len(indata)
+        if n > self.capacity:
+            indata = indata[-self.capacity :]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+        pos = self.write_pos % self.capacity
+        first = min(n, self.capacity - pos)
+        # 写入主区和镜像区
+        self.data[pos : pos + first] = indata[:first]
+        self.data[pos + self.capacity : pos + self.capacity + first] = indata[:first]
+        if first < n:
+            self.data[: n - first] = indata[first:]
+            self.data[self.capacity : self.capacity + n - first] = indata[first:]
+        self.write_pos += n
+
+    def __len__(self):
+        return min(self.write_pos - self.start_pos, self.capacity)
+
+    @property
+    def overflowed(self):
+        """录音是否超过最大时长(开头已被覆盖)"""
+        return self.write_pos - self.start_pos > self.capacity
+
+    def view(self, start=None):
+        """返回从start(默认为录音起点)到当前写入位置的numpy视图"""
+        end = self.write_pos
+        start = self.start_pos if start is None else start
+        start = max(start, end - self.capacity)
+        offset = start % self.capacity
+        return self.data[offset : offset + end - start]
+
+
+def as_bytes(audio_data):
+    """以字节为单位的memoryview,供上传使用而不复制数据"""
+    return memoryview(np.ascontiguousarray(audio_data)).cast("B")
+
+
+def benchmark(seconds=10, block=160, sample_rate=16000):
+    """对比每秒音频的分配次数,分配字节数和耗时"""
+    blocks = [
+        np.random.randint(-3000, 3000, (block, 1), dtype=np.int16)
+        for _ in range(seconds * sample_rate // block)
+    ]
+
+    def legacy():
+        buffer = []
+        for indata in blocks:
+            buffer.append(indata.copy())
+        return buffer, np.concatenate(buffer).tobytes()
+
+    ring = RingBuffer(seconds + 1, sample_rate)
+
+    def ringbuffer():
+        ring.reset()
+        for indata in blocks:
+            ring.write(indata)
+        return as_bytes(ring.view())
+
+    # 只统计numpy数据区的分配,不含Python对象本身
+    numpy_only = [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]
+    results = {}
+    for name, func in (("list+concatenate", legacy), ("RingBuffer", ringbuffer)):
+        # 耗时在关闭tracemalloc时单独测量
+        stime = time.perf_counter()
+        func()
+        cost = time.perf_counter() - stime
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot().filter_traces(numpy_only)
+        blocks_before = sys.getallocatedblocks()
+        kept = func()  # 持有返回值,使录音期间的分配在快照中可见
+        objects = sys.getallocatedblocks() - blocks_before
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(numpy_only)
+        tracemalloc.stop()
+        del kept
+        allocations = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+        results[name] = (allocations / seconds, peak / seconds, cost / seconds)
+        print(
+            f"{name:>16}: 数据区分配{allocations / seconds:.0f}次/秒音频,"
+            f"Python对象块{objects / seconds:+.0f}/秒音频,"
+            f"峰值额外内存{peak / seconds / 1024:.1f}KB/秒音频,"
+            f"耗时{cost / seconds * 1000:.3f}ms/秒音频"
+        )
+    saved = results["list+concatenate"][0] - results["RingBuffer"][0]
+    print(f"每秒音频节省{saved:.0f}次数据区分配")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
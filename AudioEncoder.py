@@ -0,0 +1,197 @@
+"""录音上传前的预处理和编码
+
+预处理(去直流、峰值归一化、混合声道、重采样)全部为numpy向量运算.
+去直流和归一化默认关闭:单声道、采样率符合要求的pcm录音可以不经复制直接上传,
+识别服务收到的也是原始电平.录音电平偏低或有明显直流偏置时可以开启,
+代价是每次上传多一次完整的复制和计算.
+编码格式按服务商支持的格式和本机可用的编码器选择:pcm和wav始终可用,
+flac需要soundfile,m4a需要ffmpeg.
+
+python AudioEncoder.py 可比较各格式的体积、编码耗时和估计的上传耗时
+"""
+import io
+import os
+import time
+import wave
+import shutil
+import logging
+import tempfile
+import subprocess
+import numpy as np
+import Tracing
+from AudioBuffer import as_bytes
+
+try:
+    import soundfile
+except (ImportError, OSError):
+    soundfile = None
+
+default_config = {
+    "format": "pcm",  # 上传格式,auto表示服务商支持且本机可用的体积最小的格式
+    "dc_remove": False,  # 去除直流偏置
+    "normalize": False,  # 峰值归一化,会改变识别服务收到的电平
+    "target_peak": 0.9,  # 归一化后的峰值(满幅的比例)
+    "max_gain": 8.0,  # 最大放大倍数,避免把安静录音中的噪声放大
+    "bitrate": "32k",  # 有损压缩格式的码率
+}
+
+# auto模式下按体积从小到大尝试
+compact_order = ("m4a", "flac", "pcm", "wav")
+
+
+def lowpass(x, cutoff, taps=127):
+    """加窗sinc低通滤波,cutoff为相对采样率的截止频率(0~0.5)"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return np.convolve(x, kernel / kernel.sum(), mode="same")
+
+
+def resample(x, in_rate, out_rate):
+    """线性插值重采样,降采样前先低通滤波防止混叠"""
+    if in_rate == out_rate or not len(x):
+        return x
+    if out_rate < in_rate:
+        x = lowpass(x, 0.45 * out_rate / in_rate)
+    count = int(len(x) * out_rate / in_rate)
+    positions = np.arange(count) * (in_rate / out_rate)
+    return np.interp(positions, np.arange(len(x)), x)
+
+
+def preprocess(audio, in_rate, out_rate, config):
+    """返回一维int16单声道音频"""
+    x = audio.astype(np.float32)
+    if x.ndim == 2:
+        x = x.mean(axis=1)
+    if config["dc_remove"]:
+        x -= x.mean()
+    x = resample(x, in_rate, out_rate)
+    if config["normalize"] and len(x):
+        peak = np.abs(x).max()
+        if peak > 0:
+            x *= min(config["target_peak"] * 32767 / peak, config["max_gain"])
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def encode_pcm(pcm, rate, config):
+    return as_bytes(pcm)
+
+
+def encode_wav(pcm, rate, config):
+    data = io.BytesIO()
+    with wave.open(data, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(as_bytes(pcm))
+    return data.getvalue()
+
+
+def encode_flac(pcm, rate, config):
+    data = io.BytesIO()
+    soundfile.write(data, pcm, rate, format="FLAC", subtype="PCM_16")
+    return data.getvalue()
+
+
+def encode_m4a(pcm, rate, config):
+    """ffmpeg编码为AAC;mp4的索引写在文件末尾,输出到临时文件而不是管道"""
+    fd, path = tempfile.mkstemp(suffix=".m4a")
+    os.close(fd)
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error", "-f", "s16le", "-ar", str(rate), "-ac", "1",
+                "-i", "pipe:0", "-c:a", "aac", "-b:a", config["bitrate"], "-movflags", "+faststart", path,
+            ],
+            input=as_bytes(pcm), check=True, capture_output=True,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+        )
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+# 格式 -> (编码函数, 本机是否可用)
+encoders = {
+    "pcm": (encode_pcm, lambda: True),
+    "wav": (encode_wav, lambda: True),
+    "flac": (encode_flac, lambda: soundfile is not None),
+    "m4a": (encode_m4a, lambda: shutil.which("ffmpeg") is not None),
+}
+
+
+def available(name):
+    return name in encoders and encoders[name][1]()
+
+
+class AudioEncoder:
+    """单个服务商的上传编码:formats和sample_rates为服务商接受的格式和采样率"""
+
+    def __init__(self, config, formats, sample_rates, in_rate, name=""):
+        self.config = {**default_config, **config}
+        self.name = name
+        self.in_rate = in_rate
+        self.out_rate = in_rate if in_rate in sample_rates else sample_rates[0]
+        self.format = self.choose(formats)
+        # 无需任何处理时直接上传录音缓冲区的视图
+        self.passthrough = (
+            self.format == "pcm" and self.out_rate == in_rate
+            and not self.config["dc_remove"] and not self.config["normalize"]
+        )
+
+    def choose(self, formats):
+        wanted = self.config["format"]
+        candidates = [f for f in compact_order if f in formats] if wanted == "auto" else [wanted]
+        for name in candidates:
+            if name in formats and available(name):
+                return name
+        logging.warning(f"{self.name}不支持或本机无法编码{wanted}格式,将上传pcm")
+        return "pcm"
+
+    def encode(self, audio):
+        """返回(上传数据, 格式, 采样率, 统计),统计包含字节数和编码耗时"""
+        stime = time.perf_counter()
+        if self.passthrough and audio.ndim == 2 and audio.shape[1] == 1:
+            data, name = as_bytes(audio), "pcm"
+        else:
+            pcm = preprocess(audio, self.in_rate, self.out_rate, self.config)
+            name = self.format
+            try:
+                data = encoders[name][0](pcm, self.out_rate, self.config)
+            except Exception as e:
+                logging.warning(f"{self.name}编码{name}失败,之后改为上传pcm:{e}")
+                self.format = name = "pcm"
+                data = encode_pcm(pcm, self.out_rate, self.config)
+        cost = time.perf_counter() - stime
+        Tracing.observe("encode", name, cost)
+        stats = {"format": name, "bytes": len(data), "encode_ms": round(cost * 1000, 2)}
+        logging.info(
+            f"{self.name}上传音频:{name},{self.out_rate}Hz,{len(data)}字节"
+            f"(原始{audio.nbytes}字节),编码耗时{cost * 1000:.1f}ms"
+        )
+        return data, name, self.out_rate, stats
+
+
+def benchmark(seconds=3.0, rate=16000, uplink_kbps=256):
+    """比较本机可用的各格式:体积、编码耗时和按上行带宽估计的上传耗时"""
+    t = np.arange(int(seconds * rate)) / rate
+    voice = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in range(1, 6)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    audio = (0.2 * voice * 32767 + 300).astype(np.int16).reshape(-1, 1)
+    for name in encoders:
+        if not available(name):
+            print(f"{name:>5}: 本机不可用")
+            continue
+        encoder = AudioEncoder({"format": name}, tuple(encoders), (rate,), rate, name)
+        costs = []
+        for _ in range(5):
+            data, _, _, stats = encoder.encode(audio)
+            costs.append(stats["encode_ms"])
+        upload = len(data) * 8 / uplink_kbps
+        print(
+            f"{name:>5}: {len(data):>7}字节,编码{min(costs):7.2f}ms,"
+            f"上传约{upload:7.0f}ms({uplink_kbps}kbps),合计{min(costs) + upload:7.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
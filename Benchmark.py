@@ -0,0 +1,483 @@
+"""离线基准测试
+
+python Benchmark.py                 运行全部场景,与已保存的基线对比
+python Benchmark.py llm parse       只运行指定场景
+python Benchmark.py --save          将本次结果保存为基线
+
+LLM和实时语音识别使用MockServer中的本地替身服务,音频为合成的WAV,
+不需要麦克风和网络,可在无界面的Linux上运行.有性能退步时退出码为1.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import wave
+import random
+import logging
+import platform
+import argparse
+import importlib.util
+import importlib.machinery
+import numpy as np
+import Tracing
+import Executor
+import Globals
+import Pipeline
+from MockServer import ChatServer, RealtimeASRServer
+
+default_baseline = "cache/benchmark.json"
+
+# 脚本化的命令和替身LLM对应的回答
+workload = [
+    ("打开连点", "```python\nstart_autoclick()\n```"),
+    ("关闭准星", "```python\nstop_crosshair()\n```"),
+    ("把连点间隔设为0.01秒然后打开准星",
+     "```python\nset_interval(0.01)\nstart_autoclick()\n```\n```python\nstart_crosshair()\n```"),
+    ("打开记事本", "```powershell\nStart-Process notepad\n```"),
+    ("清理临时文件并显示剩余空间",
+     "```powershell\nRemove-Item $env:TEMP\\* -Recurse -Force -ErrorAction SilentlyContinue\n"
+     "Get-PSDrive C | Select-Object Used,Free\n```"),
+    ("打开浏览器搜索天气", "```python\nimport webbrowser\nwebbrowser.open('https://www.bing.com/search?q=天气')\n```"),
+]
+
+scenarios = {}
+
+
+def scenario(name):
+    def register(function):
+        scenarios[name] = function
+        return function
+    return register
+
+
+class Result:
+    """一个场景的耗时样本"""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.bytes = None  # 编码场景的输出字节数
+
+    def measure(self, function, *args):
+        stime = time.perf_counter()
+        try:
+            function(*args)
+        except Exception as e:
+            self.errors += 1
+            logging.debug(f"{self.name}出错:{e}")
+        cost = time.perf_counter() - stime
+        self.samples.append(cost)
+        self.elapsed += cost
+
+    def summary(self):
+        histogram = Tracing.Histogram(None)
+        for sample in self.samples:
+            histogram.add(sample)
+        p50, p90, p99 = histogram.percentiles(50, 90, 99)
+        summary = {
+            "count": len(self.samples),
+            "errors": self.errors,
+            "throughput": len(self.samples) / self.elapsed if self.elapsed else 0.0,
+            "mean_ms": sum(self.samples) / len(self.samples) * 1000,
+            "p50_ms": p50 * 1000,
+            "p90_ms": p90 * 1000,
+            "p99_ms": p99 * 1000,
+        }
+        if self.bytes is not None:
+            summary["bytes"] = self.bytes
+        return summary
+
+
+def synthetic_wav(seconds=1.5, sample_rate=16000, seed=0):
+    """生成"静音-语音-静音"的WAV文件内容,语音段为带包络的谐波加噪声"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    voice = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(np.pi * (t - 0.3) / (seconds - 0.6)), 0, None) * ((t > 0.3) & (t < seconds - 0.3))
+    signal = 0.3 * voice * envelope * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)) + rng.normal(0, 0.002, n)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    data = io.BytesIO()
+    with wave.open(data, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return data.getvalue()
+
+
+def read_wav(data):
+    """读取WAV内容,返回与录音缓冲区相同形状的int16数组(样本数, 声道数)"""
+    with wave.open(io.BytesIO(data), "rb") as f:
+        frames = f.readframes(f.getnframes())
+        return np.frombuffer(frames, dtype=np.int16).reshape(-1, f.getnchannels())
+
+
+def bench_config(args, **overrides):
+    """基于config.json的配置,指向本地替身服务并关闭缓存、代理和重试"""
+    config = json.load(open("config.json", encoding="utf-8"))
+    config.update({
+        "key": "sk-benchmark-local",
+        "proxies": None,
+        "http": {**config.get("http", {}), "retries": 0, "warm_interval": 0},
+        "cache": {**config.get("cache", {}), "enabled": False},
+        "routing": {**config.get("routing", {}), "hedge": False},
+    })
+    config.update(overrides)
+    return config
+
+
+def start_chat_server(args, **kwargs):
+    server = ChatServer(
+        ("127.0.0.1", 0), dict(workload), latency=args.llm_latency, jitter=args.llm_latency / 5,
+        token_delay=args.token_delay, error_rate=args.error_rate, **kwargs,
+    )
+    return server, server.start()
+
+
+def run_llm(args, stream):
+    import LLMService
+
+    server, url = start_chat_server(args)
+    config = bench_config(args, url=url)
+    config["payload"] = {**config["payload"], "stream": stream}
+    LLMService.init(config, load_catalog(config))
+    result = Result("llm_stream" if stream else "llm")
+    try:
+        for _ in range(args.repeat):
+            for prompt, _ in workload:
+                if stream:
+                    result.measure(LLMService.call_llm_api_stream, prompt, lambda tag, body: None)
+                else:
+                    result.measure(LLMService.call_llm_api, prompt)
+    finally:
+        LLMService.connection.close()
+        server.shutdown()
+    return [result]
+
+
+@scenario("llm")
+def llm(args):
+    """LLMService.call_llm_api:请求构造、路由、HTTP往返和历史维护"""
+    return run_llm(args, stream=False)
+
+
+@scenario("llm_stream")
+def llm_stream(args):
+    """LLMService.call_llm_api_stream:SSE接收和增量解析"""
+    return run_llm(args, stream=True)
+
+
+@scenario("sessions")
+def sessions(args):
+    """4个会话同时提交命令,对比1个工作线程和配置的工作线程数下的端到端延迟和吞吐"""
+    import LLMService
+
+    server, url = start_chat_server(args)
+    config = bench_config(args, url=url)
+    LLMService.init(config, load_catalog(config))
+
+    def llm_stage(ctx):
+        LLMService.call_llm_api(ctx.text, ctx)
+
+    results = []
+    try:
+        for workers in (1, config.get("sessions", {}).get("workers", 4)):
+            pipeline = Pipeline.Pipeline({**config, "sessions": {**config.get("sessions", {}), "workers": workers}})
+            result = Result(f"sessions_w{workers}")
+            contexts = []
+            stime = time.perf_counter()
+            for _ in range(args.repeat):
+                for prompt, _ in workload:
+                    for i in range(4):
+                        ctx = Pipeline.RequestContext("benchmark", prompt)
+                        ctx.session = pipeline.sessions.get(f"s{i}")
+                        pipeline.submit(ctx, [("llm", llm_stage)])
+                        contexts.append(ctx)
+            for ctx in contexts:
+                ctx.finished.wait()
+                result.samples.append(ctx.trace.duration)
+                result.errors += ctx.cancelled
+            # 并发执行,吞吐按总耗时计算
+            result.elapsed = time.perf_counter() - stime
+            pipeline.executor.shutdown()
+            results.append(result)
+    finally:
+        LLMService.connection.close()
+        server.shutdown()
+    return results
+
+
+@scenario("asr_stream")
+def asr_stream(args):
+    """实时识别会话:按20ms分块送入合成音频,测量松开按键到出结果的耗时"""
+    import SpeechService
+
+    if SpeechService.websocket is None:
+        raise ImportError("未安装websocket-client")
+    server = RealtimeASRServer(("127.0.0.1", 0), final_delay=args.asr_delay, error_rate=args.error_rate)
+    url = server.start()
+    audio = read_wav(synthetic_wav())
+    chunk = 320  # 20ms
+    result = Result("asr_stream")
+
+    def recognize():
+        session = SpeechService.RealtimeSession(url, {"format": "pcm", "sample": 16000})
+        for i in range(0, len(audio), chunk):
+            session.feed(audio[i:i + chunk].tobytes())
+        result.measure(session.finish, audio)
+
+    try:
+        for _ in range(args.repeat * len(workload)):
+            recognize()
+    finally:
+        server.shutdown()
+    return [result]
+
+
+@scenario("asr_pool")
+def asr_pool(args):
+    """语音服务池:两个替身服务之间的对冲和故障转移"""
+    import SpeechService
+
+    providers = [
+        {"name": "MockPrimary", "Priority": 1, "delay": args.asr_delay * 2,
+         "error_rate": max(args.error_rate, 0.1), "text": "打开连点"},
+        {"name": "MockBackup", "Priority": 0, "delay": args.asr_delay, "text": "打开连点"},
+    ]
+    pool = SpeechService.init(providers, {"hedge_delay": args.asr_delay * 3, "min_samples": 3})
+    audio = read_wav(synthetic_wav())
+    result = Result("asr_pool")
+    random.seed(0)
+    for _ in range(args.repeat * len(workload)):
+        result.measure(pool.recognize, audio)
+    pool.executor.shutdown()
+    return [result]
+
+
+@scenario("vad")
+def vad(args):
+    """录音结束时的首尾静音裁剪"""
+    from VAD import VAD
+
+    detector = VAD({})
+    audio = read_wav(synthetic_wav(seconds=5))
+    result = Result("vad")
+    for _ in range(args.repeat * 20):
+        result.measure(detector.trim, audio)
+    return [result]
+
+
+@scenario("encode")
+def encode(args):
+    """上传前的预处理和编码,每种本机可用的格式一行,附输出字节数"""
+    import AudioEncoder
+
+    audio = read_wav(synthetic_wav(seconds=3, sample_rate=48000))
+    results = []
+    for name in AudioEncoder.encoders:
+        if not AudioEncoder.available(name):
+            continue
+        encoder = AudioEncoder.AudioEncoder({"format": name}, (name,), (16000,), 48000, name)
+        result = Result(f"encode_{name}")
+
+        def run():
+            result.bytes = len(encoder.encode(audio)[0])
+
+        for _ in range(args.repeat * 4):
+            result.measure(run)
+        results.append(result)
+    return results
+
+
+class RecordingExecutor:
+    """不执行代码,只记录提交的任务"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, tag, code, after=None):
+        job = Executor.Job(tag, code)
+        job.finish("ok", 0)
+        self.jobs.append(job)
+        return job
+
+
+main_module = None
+qt_app = None
+
+
+def load_main():
+    """以模块方式导入main.pyw,界面使用offscreen平台"""
+    global main_module, qt_app
+    if main_module is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+
+        qt_app = QApplication.instance() or QApplication([])
+        loader = importlib.machinery.SourceFileLoader("spassit_main", "main.pyw")
+        spec = importlib.util.spec_from_loader(loader.name, loader)
+        main_module = importlib.util.module_from_spec(spec)
+        loader.exec_module(main_module)
+    return main_module
+
+
+def load_catalog(config):
+    """通过main.register_function注册模块;界面依赖不可用时使用空目录"""
+    try:
+        return register(config)
+    except ImportError as e:
+        import FunctionCatalog
+
+        logging.warning(f"无法加载模块,使用空函数目录:{e}")
+        return FunctionCatalog.FunctionCatalog(config)
+
+
+def register(config):
+    import IntentRouter
+
+    main = load_main()
+    Globals.router = IntentRouter.IntentRouter(config)
+    return main.register_function(config)
+
+
+@scenario("parse")
+def parse(args):
+    """main.response_handler提取代码块,以及流式回答的增量解析"""
+    import LLMService
+
+    main = load_main()
+    Globals.always_ask = False
+    Globals.executor = RecordingExecutor()
+    handler = Result("parse")
+    stream = Result("parse_stream")
+
+    def feed(content):
+        parser = LLMService.BlockParser()
+        for i in range(0, len(content), 4):
+            parser.feed(content[i:i + 4])
+
+    for _ in range(args.repeat * 50):
+        for prompt, content in workload:
+            ctx = Pipeline.RequestContext("benchmark", prompt)
+            ctx.response = content
+            handler.measure(main.response_handler, ctx)
+            stream.measure(feed, content)
+    return [handler, stream]
+
+
+@scenario("startup")
+def startup(args):
+    """main.register_function:无清单(冷启动)和有清单(热启动)时的模块注册"""
+    load_main()
+    manifest = os.path.join("cache", "benchmark_plugins.json")
+    config = bench_config(args)
+    config["plugins"] = {**config.get("plugins", {}), "manifest": manifest}
+    cold, warm = Result("startup_cold"), Result("startup_warm")
+    try:
+        for _ in range(args.repeat):
+            if os.path.exists(manifest):
+                os.remove(manifest)
+            # 模块在第一次之后已被导入,冷启动只在第一次包含导入耗时
+            cold.measure(register, copy.deepcopy(config))
+            warm.measure(register, copy.deepcopy(config))
+    finally:
+        if os.path.exists(manifest):
+            os.remove(manifest)
+    return [cold, warm]
+
+
+def compare(summary, baseline, tolerance, min_ms=1.0):
+    """与基线比较p50和p90,变慢超过tolerance且超过min_ms视为退步"""
+    if baseline is None:
+        return "", False
+    changes = []
+    regressed = False
+    for key in ("p50_ms", "p90_ms"):
+        old, new = baseline[key], summary[key]
+        change = (new - old) / old if old else 0.0
+        if change > tolerance and new - old > min_ms:
+            regressed = True
+        changes.append(f"{change:+.0%}")
+    return "/".join(changes) + (" 退步" if regressed else ""), regressed
+
+
+def report(results, skipped, baseline, tolerance):
+    """输出结果表,返回是否有退步"""
+    lines = [
+        f"{'场景':<12}{'次数':>6}{'错误':>6}{'吞吐(次/s)':>12}{'平均(ms)':>10}"
+        f"{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}  对比基线(p50/p90)"
+    ]
+    regressed = False
+    for name, summary in results.items():
+        change, worse = compare(summary, (baseline or {}).get(name), tolerance)
+        regressed = regressed or worse
+        lines.append(
+            f"{name:<14}{summary['count']:>8}{summary['errors']:>8}{summary['throughput']:>16.1f}"
+            f"{summary['mean_ms']:>12.2f}{summary['p50_ms']:>10.2f}{summary['p90_ms']:>10.2f}"
+            f"{summary['p99_ms']:>10.2f}  {change}"
+            + (f"  {summary['bytes']}字节" if "bytes" in summary else "")
+        )
+    for name, reason in skipped.items():
+        lines.append(f"{name:<14}跳过:{reason}")
+    print("\n".join(lines))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spassit离线基准测试")
+    parser.add_argument("scenarios", nargs="*", help=f"要运行的场景,默认全部:{', '.join(scenarios)}")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景的重复轮数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="替身LLM的响应延迟(秒)")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="替身LLM流式输出的分块间隔(秒)")
+    parser.add_argument("--asr-delay", type=float, default=0.05, help="替身语音识别的延迟(秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="替身服务随机返回错误的概率")
+    parser.add_argument("--baseline", default=default_baseline, help="基线文件")
+    parser.add_argument("--save", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="视为退步的变慢比例")
+    args = parser.parse_args()
+
+    # 相对路径(config.json、prompts.txt、modules)以程序目录为准
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs("cache", exist_ok=True)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+    Tracing.config["enabled"] = False
+
+    names = args.scenarios or list(scenarios)
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        parser.error(f"未知场景:{', '.join(unknown)}")
+
+    results, skipped = {}, {}
+    for name in names:
+        try:
+            for result in scenarios[name](args):
+                results[result.name] = result.summary()
+        except ImportError as e:
+            skipped[name] = str(e)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        baseline = json.load(open(args.baseline, encoding="utf-8"))["results"]
+    regressed = report(results, skipped, baseline, args.tolerance)
+
+    if args.save:
+        saved = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("scenarios", "save", "baseline")},
+            "results": {**(baseline or {}), **results},
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=4)
+        print(f"基线已保存:{args.baseline}")
+    return 1 if regressed and not args.save else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
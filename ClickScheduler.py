@@ -0,0 +1,199 @@
+"""按截止时间调度的连点器
+
+python ClickScheduler.py 可在无鼠标的环境下运行基准,对比sleep循环与截止时间调度
+"""
+import time
+import logging
+import threading
+from collections import deque
+
+default_config = {
+    "interval": 0.003,
+    "spin_threshold": 0.002,  # 距下一次点击不足该时间时改为忙等,以获得亚毫秒精度
+    "max_lag": 0.05,  # 落后超过该时间时放弃补点,从当前时刻重新计时
+}
+
+
+class MouseBackend:
+    """鼠标后端接口,button为"left"或"right\""""
+
+    def click(self, button):
+        raise NotImplementedError
+
+
+class PynputBackend(MouseBackend):
+    """复用同一个pynput控制器"""
+
+    def __init__(self):
+        from pynput import mouse
+
+        self.controller = mouse.Controller()
+        self.buttons = {"left": mouse.Button.left, "right": mouse.Button.right}
+
+    def click(self, button):
+        self.controller.click(self.buttons[button])
+
+
+class RecordingBackend(MouseBackend):
+    """不操作鼠标,只记录点击时刻,用于基准测试"""
+
+    def __init__(self):
+        self.clicks = []
+
+    def click(self, button):
+        self.clicks.append((time.perf_counter(), button))
+
+
+class ClickStats:
+    """统计实际点击频率和间隔抖动"""
+
+    def __init__(self, size=2000):
+        self.intervals = deque(maxlen=size)
+        self.count = 0
+        self.skipped = 0
+        self.first = self.last = None
+
+    def record(self, now):
+        if self.last is not None:
+            self.intervals.append(now - self.last)
+        else:
+            self.first = now
+        self.last = now
+        self.count += 1
+
+    def summary(self, interval):
+        if self.count < 2:
+            return None
+        elapsed = self.last - self.first
+        intervals = sorted(self.intervals)
+        mean = sum(intervals) / len(intervals)
+        jitter = (sum((x - mean) ** 2 for x in intervals) / len(intervals)) ** 0.5
+        return {
+            "clicks": self.count,
+            "rate": (self.count - 1) / elapsed if elapsed > 0 else 0.0,
+            "target_rate": 1 / interval,
+            "mean_ms": mean * 1000,
+            "jitter_ms": jitter * 1000,
+            "p99_ms": intervals[int(len(intervals) * 0.99)] * 1000,
+            "skipped": self.skipped,
+        }
+
+
+class ClickScheduler:
+    """单线程连点调度器
+
+    没有按键处于连点状态时线程阻塞在事件上,不占用CPU.
+    每次点击的时刻由perf_counter截止时间决定,sleep的误差不会累积;
+    剩余时间较长时sleep,临近截止时间时忙等.
+    """
+
+    def __init__(self, backend, config=None):
+        self.backend = backend
+        self.config = {**default_config, **(config or {})}
+        self.interval = self.config["interval"]
+        self.active = set()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = ClickStats()
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="autoclick", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止连点并等待线程退出"""
+        with self.lock:
+            self.active.clear()
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def set_active(self, button, active):
+        with self.lock:
+            if active:
+                self.active.add(button)
+                self.wakeup.set()
+            else:
+                self.active.discard(button)
+
+    def wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.config["spin_threshold"]:
+            # stopped.wait可被stop立即打断
+            self.stopped.wait(remaining - self.config["spin_threshold"])
+        while time.perf_counter() < deadline and not self.stopped.is_set():
+            pass
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait()
+            if self.stopped.is_set():
+                break
+            self.stats = ClickStats()
+            deadline = time.perf_counter()
+            while not self.stopped.is_set():
+                with self.lock:
+                    buttons = list(self.active)
+                    if not buttons:
+                        self.wakeup.clear()
+                        break
+                for button in buttons:
+                    self.backend.click(button)
+                now = time.perf_counter()
+                self.stats.record(now)
+                deadline += self.interval
+                if now - deadline > self.config["max_lag"]:
+                    # 系统卡顿时不补点,避免之后连续快速点击
+                    self.stats.skipped += int((now - deadline) / self.interval)
+                    deadline = now
+                self.wait_until(deadline)
+            self.log_stats()
+
+    def log_stats(self):
+        summary = self.stats.summary(self.interval)
+        if summary:
+            logging.info(
+                f"连点统计:{summary['clicks']}次,{summary['rate']:.1f}次/秒(目标{summary['target_rate']:.1f}),"
+                f"平均间隔{summary['mean_ms']:.3f}ms,抖动{summary['jitter_ms']:.3f}ms,"
+                f"p99 {summary['p99_ms']:.3f}ms,跳过{summary['skipped']}次"
+            )
+        return summary
+
+
+def benchmark(interval=0.003, seconds=2.0):
+    """对比旧的sleep循环与截止时间调度的实际频率和抖动"""
+    backend = RecordingBackend()
+    stats = ClickStats()
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        backend.click("left")
+        stats.record(time.perf_counter())
+        time.sleep(interval)
+    results = {"sleep循环": stats.summary(interval)}
+
+    scheduler = ClickScheduler(RecordingBackend(), {"interval": interval})
+    scheduler.start()
+    scheduler.set_active("left", True)
+    time.sleep(seconds)
+    scheduler.set_active("left", False)
+    time.sleep(0.05)
+    results["截止时间调度"] = scheduler.stats.summary(interval)
+    scheduler.stop()
+
+    for name, summary in results.items():
+        print(
+            f"{name:>6}: {summary['rate']:.1f}次/秒(目标{summary['target_rate']:.1f}),"
+            f"平均间隔{summary['mean_ms']:.3f}ms,抖动{summary['jitter_ms']:.3f}ms,p99 {summary['p99_ms']:.3f}ms"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
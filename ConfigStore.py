@@ -0,0 +1,137 @@
+import os
+import copy
+import json
+import logging
+import threading
+
+default_config = {
+    "debounce": 2.0,  # 最后一次修改后多久写入磁盘
+}
+
+store = None
+
+
+class ConfigStore:
+    """记录被修改的配置项,延迟合并写入磁盘
+
+    写入时只把被标记的顶层键合并到磁盘上的文件中,外部对其他配置项的修改不会被覆盖.
+    先写临时文件再原子替换,内容没有变化时不写.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.data = json.load(f)
+        self.config = {**default_config, **self.data.get("config_store", {})}
+        self.dirty = set()
+        self.timer = None
+        self.lock = threading.RLock()
+
+    def update(self, key, values):
+        """修改一个配置节中的若干项并标记为待保存"""
+        with self.lock:
+            section = self.data.setdefault(key, {})
+            changed = {k: v for k, v in values.items() if section.get(k, object()) != v}
+            section.update(changed)
+        if changed:
+            self.mark_dirty(key)
+        return changed
+
+    def mark_dirty(self, *keys):
+        """标记顶层配置项已被修改,debounce秒内没有新的修改时写入"""
+        with self.lock:
+            self.dirty.update(keys)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.config["debounce"], self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def snapshot(self, key=None):
+        """返回配置(或其中一节)的深拷贝,调用者可以随意读取"""
+        with self.lock:
+            return copy.deepcopy(self.data if key is None else self.data.get(key))
+
+    def merge(self, config):
+        """配置文件被外部修改后就地合并,保留模块持有的子字典引用,尚未保存的修改优先"""
+        with self.lock:
+            pending = {key: self.data[key] for key in self.dirty if key in self.data}
+            merge_dict(self.data, {**config, **pending})
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    on_disk = json.load(f)
+            except (OSError, ValueError):
+                on_disk = {}
+            merged = dict(on_disk)
+            for key in self.dirty:
+                if key in self.data:
+                    merged[key] = self.data[key]
+            keys = sorted(self.dirty)
+            self.dirty.clear()
+            if merged == on_disk:
+                logging.info(f"配置未变化,跳过保存:{keys}")
+                return
+            text = json.dumps(merged, ensure_ascii=False, indent=4)
+
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            logging.info(f"配置已保存:{keys}")
+        except OSError as e:
+            logging.error(f"配置保存失败:{e}")
+            with self.lock:
+                self.dirty.update(keys)
+
+
+def merge_dict(target, source):
+    for key in list(target):
+        if key not in source:
+            del target[key]
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_dict(target[key], value)
+        else:
+            target[key] = value
+
+
+def init(path="config.json"):
+    """加载配置文件,返回可供各模块共享的配置字典"""
+    global store
+    store = ConfigStore(path)
+    return store.data
+
+
+def update(key, values):
+    if store is not None:
+        return store.update(key, values)
+
+
+def mark_dirty(*keys):
+    if store is not None:
+        store.mark_dirty(*keys)
+
+
+def snapshot(key=None):
+    return store.snapshot(key)
+
+
+def merge(config):
+    if store is not None:
+        store.merge(config)
+
+
+def flush():
+    if store is not None:
+        store.flush()
@@ -0,0 +1,213 @@
+import time
+import socket
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 记录当前线程内建立连接(含TLS握手)的耗时,以及当前请求的中止句柄
+_local = threading.local()
+
+default_config = {
+    "connect_timeout": 5,
+    "read_timeout": 60,
+    "retries": 2,
+    "backoff_factor": 0.5,
+    "pool_size": 4,
+    "warm_interval": 60,
+}
+
+
+def _add_connect_time(seconds):
+    _local.connect_time = getattr(_local, "connect_time", 0) + seconds
+
+
+class AbortHandle:
+    """一次调用中进行中请求的中止句柄,可在其他线程中调用abort()
+
+    请求发出时所用的连接登记到句柄上,abort()关闭这些连接的套接字,
+    阻塞在读取中的请求随即抛出异常,之后发出的请求直接失败.
+    连接归还连接池前必须解除登记,以免中止其他请求复用的连接.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.aborted = False
+
+    def attach(self, connection):
+        with self.lock:
+            if self.aborted:
+                raise requests.ConnectionError("请求已中止")
+            self.connections.add(connection)
+
+    def detach(self, connection):
+        with self.lock:
+            self.connections.discard(connection)
+
+    def release(self):
+        """解除全部登记,用于关闭流式响应之后"""
+        with self.lock:
+            self.connections.clear()
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            connections, self.connections = self.connections, set()
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class TimedConnectionMixin:
+    """记录建立连接的耗时,并将连接登记到当前线程的中止句柄上"""
+
+    def connect(self):
+        stime = time.perf_counter()
+        super().connect()
+        _add_connect_time(time.perf_counter() - stime)
+
+    def request(self, *args, **kwargs):
+        abort = getattr(_local, "abort", None)
+        if abort is not None:
+            abort.attach(self)
+            _local.connection = self
+        return super().request(*args, **kwargs)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+timed_pool_classes = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+class TimedAdapter(HTTPAdapter):
+    """连接池中的新连接会记录建立耗时"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = timed_pool_classes
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = timed_pool_classes
+        return manager
+
+
+class ConnectionManager:
+    """持久化的HTTP会话,负责连接复用,预热,超时重试和耗时统计"""
+
+    def __init__(self, url, config):
+        self.config = {**default_config, **config.get("http", {})}
+        parts = urlsplit(url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}/"
+        self.timeout = (self.config["connect_timeout"], self.config["read_timeout"])
+        self.last_used = 0
+        self.last_latency = None
+        self.stop_event = threading.Event()
+
+        # 重试连接失败和限流/网关错误;读取超时时服务器可能已在处理请求,
+        # 重试POST会重复请求,且最坏耗时(重试次数+1)*read_timeout会超出流水线的llm阶段时限
+        retry = Retry(
+            total=self.config["retries"],
+            read=0,
+            backoff_factor=self.config["backoff_factor"],
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = TimedAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config["pool_size"],
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if config.get("proxies"):
+            self.session.proxies = {
+                "http": config["proxies"],
+                "https": config["proxies"],
+            }
+
+        logging.info(
+            f"-连接超时:{self.timeout[0]}s,读取超时:{self.timeout[1]}s,"
+            f"重试次数:{self.config['retries']}(读取超时不重试),代理:{config.get('proxies') or '无'}"
+        )
+
+    def start(self):
+        """后台预热连接,并在空闲后重新预热"""
+        threading.Thread(target=self.warm, daemon=True).start()
+        if self.config["warm_interval"] > 0:
+            threading.Thread(target=self._keep_warm, daemon=True).start()
+
+    def _keep_warm(self):
+        interval = self.config["warm_interval"]
+        while not self.stop_event.wait(interval):
+            if time.time() - self.last_used >= interval:
+                self.warm()
+
+    def warm(self):
+        """建立(或保持)到服务器的连接,任何响应都视为成功"""
+        _local.connect_time = 0
+        stime = time.perf_counter()
+        try:
+            self.session.head(self.base_url, timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.warning(f"连接预热失败:{e}")
+            return
+        self.last_used = time.time()
+        logging.info(
+            f"连接预热完成,耗时:{time.perf_counter() - stime:.3f}s,"
+            f"其中建立连接:{_local.connect_time:.3f}s"
+        )
+
+    def post(self, url, abort=None, **kwargs):
+        """发送POST请求,记录连接耗时和服务器耗时
+
+        abort为AbortHandle时,在其他线程调用abort.abort()可中止进行中的请求.
+        非流式请求返回时响应已读完,连接随即解除登记;流式请求的连接保持登记,
+        调用方关闭响应后应调用abort.release().
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        _local.connect_time = 0
+        _local.abort, _local.connection = abort, None
+        try:
+            response = self.session.post(url, **kwargs)
+        finally:
+            if abort is not None and _local.connection is not None and not kwargs.get("stream"):
+                abort.detach(_local.connection)
+            _local.abort, _local.connection = None, None
+        self.last_used = time.time()
+
+        connect_time = _local.connect_time
+        server_time = max(response.elapsed.total_seconds() - connect_time, 0)
+        self.last_latency = {"connect": connect_time, "server": server_time}
+        logging.info(f"请求耗时:建立连接{connect_time:.3f}s,服务器响应{server_time:.3f}s")
+        return response
+
+    def close(self):
+        self.stop_event.set()
+        self.session.close()
@@ -0,0 +1,447 @@
+import os
+import sys
+import time
+import uuid
+import queue
+import signal
+import base64
+import logging
+import Tracing
+import importlib
+import itertools
+import threading
+import traceback
+import subprocess
+import multiprocessing
+
+default_config = {
+    "workers": 2,  # 预热的python子进程数
+    "timeout": 120,  # 单个任务的最长运行时间(秒),null表示不限
+    "shell": "powershell" if os.name == "nt" else "sh",
+}
+
+# 持久shell的启动命令和每条任务的包装模板,代码以base64传入,结束时输出标记和退出码
+shells = {
+    "powershell": (
+        ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-Command", "-"],
+        "[Console]::OutputEncoding = [Text.Encoding]::UTF8",
+        "$__code = 0; $global:LASTEXITCODE = 0; "
+        "try { & ([ScriptBlock]::Create([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{code}')))) 2>&1 | Out-String -Stream } "
+        "catch { $_ | Out-String -Stream; $__code = 1 }; "
+        "if ($LASTEXITCODE) { $__code = $LASTEXITCODE }; Write-Output \"{marker} $__code\"",
+    ),
+    "sh": (
+        ["sh"],
+        "",
+        "( eval \"$(echo {code} | base64 -d)\" ) 2>&1; echo \"{marker} $?\"",
+    ),
+}
+
+
+def kill_tree(process):
+    """结束进程及其子进程(如shell中启动的pip)"""
+    if process.poll() is not None:
+        return
+    if os.name == "nt":
+        subprocess.run(
+            ["taskkill", "/T", "/F", "/PID", str(process.pid)],
+            capture_output=True, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+        )
+    else:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+class Job:
+    """一次代码执行,可等待、可取消"""
+
+    ids = itertools.count(1)
+
+    def __init__(self, tag, code):
+        self.id = next(self.ids)
+        self.tag = tag
+        self.code = code
+        self.status = "pending"  # pending/running/ok/error/timeout/cancelled
+        self.exit_code = None
+        self.error = None
+        self.done = threading.Event()
+        self.abort = None  # 运行中任务的中止方法
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            if self.done.is_set():
+                return
+            self.status = "cancelled"
+            abort = self.abort
+        if abort is not None:
+            abort()
+
+    def start(self, abort):
+        """开始运行,已被取消时返回False"""
+        with self.lock:
+            if self.status == "cancelled":
+                return False
+            self.status = "running"
+            self.abort = abort
+            self.started = time.perf_counter()
+            return True
+
+    def finish(self, status, exit_code=None, error=None):
+        with self.lock:
+            if self.status in ("cancelled", "timeout"):
+                status = self.status
+            self.status = status
+            self.exit_code = exit_code
+            self.error = error
+            self.abort = None
+            self.finished = time.perf_counter()
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """等待任务结束,返回退出码"""
+        self.done.wait(timeout)
+        return self.exit_code
+
+
+class Output:
+    """子进程中替换stdout/stderr,按行发回主进程"""
+
+    def __init__(self, send):
+        self.send = send
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.send(("out", line))
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send(("out", self.buffer))
+            self.buffer = ""
+
+
+def worker_main(conn, specs):
+    """python子进程入口:准备模块函数,之后循环执行任务
+
+    模块的init只在主进程中执行一次;PURE模块的函数在此直接导入,其余模块的函数是RPC代理.
+    """
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+
+    sys.stdout = sys.stderr = Output(send)
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(message)s")
+
+    def proxy(name):
+        """在主进程(GUI线程)执行的函数,通过RPC调用"""
+        def call(*args, **kwargs):
+            send(("call", name, args, kwargs))
+            ok, value = conn.recv()
+            if not ok:
+                raise RuntimeError(value)
+            return value
+        call.__name__ = name
+        return call
+
+    namespace = {"__name__": "__main__"}
+    for module_name, functions, pure in specs:
+        try:
+            if not pure:
+                namespace.update({name: proxy(name) for name in functions})
+                continue
+            module = importlib.import_module(f"modules.{module_name}")
+            namespace.update({name: getattr(module, name) for name in functions})
+        except Exception as e:
+            print(f"执行进程加载模块失败:{module_name}:{e}")
+    send(("ready",))
+
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            break
+        try:
+            exec(code, dict(namespace))
+            sys.stdout.flush()
+            send(("done", 0, None))
+        except BaseException as e:
+            traceback.print_exc()
+            sys.stdout.flush()
+            send(("done", 1, f"{type(e).__name__}: {e}"))
+
+
+class PythonWorker:
+    """预热的python执行进程"""
+
+    def __init__(self, specs, generation):
+        self.generation = generation
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child, specs), daemon=True)
+        self.process.start()
+        child.close()
+
+    def wait_ready(self):
+        """等待模块准备完成,期间的输出(如模块加载失败的提示)写入日志"""
+        try:
+            while True:
+                message = self.conn.recv()
+                if message[0] != "out":
+                    return message == ("ready",)
+                logging.warning(message[1])
+        except (EOFError, OSError):
+            return False
+
+    def kill(self):
+        """结束进程,正在等待结果的线程会收到EOFError"""
+        if self.process.is_alive():
+            self.process.kill()
+
+    def close(self):
+        self.kill()
+        self.conn.close()
+
+
+class ShellHost:
+    """常驻的powershell(或sh)进程,每条命令不再单独启动进程"""
+
+    def __init__(self, name):
+        self.command, self.setup, self.template = shells[name]
+        self.process = None
+        self.lines = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        flags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding="utf-8", errors="replace", bufsize=1, creationflags=flags,
+            start_new_session=os.name != "nt",
+        )
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, args=(self.process, self.lines), daemon=True).start()
+        if self.setup:
+            self.process.stdin.write(self.setup + "\n")
+            self.process.stdin.flush()
+
+    @staticmethod
+    def read(process, lines):
+        for line in process.stdout:
+            lines.put(line.rstrip("\r\n"))
+        lines.put(None)
+
+    def kill(self):
+        if self.process is not None:
+            kill_tree(self.process)
+            # 不等待输出管道关闭,立即结束正在等待的任务
+            self.lines.put(None)
+
+    def run(self, job, timeout, on_output):
+        """执行一条命令,返回(状态, 退出码)"""
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            if not job.start(self.kill):
+                return "cancelled", None
+            marker = f"__spassit_{uuid.uuid4().hex}__"
+            code = base64.b64encode(job.code.encode("utf-8")).decode("ascii")
+            line = self.template.replace("{code}", code).replace("{marker}", marker)
+            try:
+                self.process.stdin.write(line + "\n")
+                self.process.stdin.flush()
+            except OSError:
+                self.process = None
+                return "error", None
+            timer = None
+            if timeout:
+                timer = threading.Timer(timeout, lambda: self.expire(job))
+                timer.daemon = True
+                timer.start()
+            try:
+                while True:
+                    line = self.lines.get()
+                    if line is None:
+                        # 进程被结束(取消或超时),下次执行时重新启动
+                        self.process = None
+                        return job.status, None
+                    if line.startswith(marker):
+                        exit_code = int(line.split()[-1])
+                        return ("ok" if exit_code == 0 else "error"), exit_code
+                    on_output(job, line)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def expire(self, job):
+        with job.lock:
+            if job.status != "running":
+                return
+            job.status = "timeout"
+        self.kill()
+
+
+class Executor:
+    """在子进程中执行LLM生成的代码,不阻塞GUI线程
+
+    python代码在预热的进程池中执行.模块函数在子进程中默认是代理,经rpc回到主进程的GUI线程执行,
+    与直接调用时的约定一致;PURE = True的模块在子进程中直接调用.powershell代码在常驻shell中执行.
+    """
+
+    def __init__(self, config, specs, rpc, on_output=None):
+        self.config = {**default_config, **config.get("executor", {})}
+        self.specs = specs
+        self.rpc = rpc  # rpc(name, args, kwargs) -> 返回值,在主进程执行
+        self.on_output = on_output or (lambda job, line: logging.info(f"[{job.tag}#{job.id}] {line}"))
+        self.generation = 0
+        self.idle = queue.Queue()
+        self.shell = ShellHost(self.config["shell"])
+        self.closed = False
+        threading.Thread(target=self.prewarm, daemon=True).start()
+
+    def prewarm(self):
+        for _ in range(self.config["workers"]):
+            self.spawn()
+
+    def spawn(self):
+        """启动一个新的执行进程,就绪后放入空闲队列;启动失败时退避后重试,保持进程数不变"""
+        def start(generation):
+            delay = 1
+            while not self.closed and generation == self.generation:
+                try:
+                    worker = PythonWorker(self.specs, generation)
+                    ready = worker.wait_ready()
+                except Exception as e:
+                    worker, ready = None, False
+                    logging.error(f"执行进程启动失败:{e}")
+                if ready and not self.closed:
+                    self.idle.put(worker)
+                    return
+                if worker is not None:
+                    worker.close()
+                if self.closed:
+                    return
+                logging.warning(f"执行进程未能就绪,{delay}s后重试")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+        threading.Thread(target=start, args=(self.generation,), daemon=True).start()
+
+    def reload(self, specs):
+        """模块变化后用新的函数列表替换所有执行进程"""
+        self.specs = specs
+        self.generation += 1
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.prewarm()
+
+    def submit(self, tag, code, after=None):
+        """提交代码,after为需要先完成的任务(同一回答中的代码按顺序执行)"""
+        job = Job(tag, code)
+        target = self.run_python if tag == "python" else self.run_shell
+        threading.Thread(target=self.execute, args=(job, target, after), daemon=True).start()
+        return job
+
+    def execute(self, job, target, after):
+        if after is not None:
+            after.wait()
+        stime = time.perf_counter()
+        try:
+            status, exit_code, error = target(job)
+        except Exception as e:
+            status, exit_code, error = "error", None, str(e)
+        job.finish(status, exit_code, error)
+        cost = time.perf_counter() - stime
+        Tracing.observe("execute", job.tag, cost)
+        message = f"执行{job.tag}#{job.id}:{job.status},退出码{job.exit_code},耗时{cost:.2f}s"
+        if job.status in ("ok", "cancelled"):
+            logging.info(message)
+        else:
+            logging.error(f"{message}{',' + job.error if job.error else ''}")
+
+    def run_shell(self, job):
+        status, exit_code = self.shell.run(job, self.config["timeout"], self.on_output)
+        return status, exit_code, None
+
+    def acquire(self, job):
+        """等待空闲的执行进程,任务被取消、超时或执行器关闭时返回(None, 状态, 错误)"""
+        timeout = self.config["timeout"]
+        deadline = time.perf_counter() + timeout if timeout else None
+        while True:
+            if job.status == "cancelled":
+                return None, "cancelled", None
+            if self.closed:
+                return None, "error", "执行器已关闭"
+            if deadline is not None and time.perf_counter() > deadline:
+                return None, "timeout", f"等待执行进程超过{timeout}s"
+            try:
+                worker = self.idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if worker.generation == self.generation:
+                return worker, None, None
+            worker.close()
+
+    def run_python(self, job):
+        worker, status, error = self.acquire(job)
+        if worker is None:
+            return status, None, error
+        if not job.start(worker.kill):
+            self.idle.put(worker)
+            return "cancelled", None, None
+
+        timer = None
+        if self.config["timeout"]:
+            timer = threading.Timer(self.config["timeout"], lambda: self.expire(job, worker))
+            timer.daemon = True
+            timer.start()
+        try:
+            worker.conn.send(job.code)
+            while True:
+                message = worker.conn.recv()
+                if message[0] == "out":
+                    self.on_output(job, message[1])
+                elif message[0] == "call":
+                    _, name, args, kwargs = message
+                    try:
+                        reply = (True, self.rpc(name, args, kwargs))
+                    except Exception as e:
+                        reply = (False, f"{type(e).__name__}: {e}")
+                    worker.conn.send(reply)
+                elif message[0] == "done":
+                    _, exit_code, error = message
+                    self.idle.put(worker)
+                    return ("ok" if exit_code == 0 else "error"), exit_code, error
+        except (EOFError, OSError):
+            # 进程被结束(取消或超时),补充一个新进程
+            worker.close()
+            self.spawn()
+            return job.status, None, None
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def expire(self, job, worker):
+        with job.lock:
+            if job.status != "running":
+                return
+            job.status = "timeout"
+        worker.kill()
+
+    def close(self):
+        self.closed = True
+        self.shell.kill()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,119 @@
+import os
+import logging
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+            if getattr(event, "dest_path", None):
+                self.watcher.notify(event.dest_path)
+
+
+class FileWatcher:
+    """监视文件和目录的变化,优先使用系统事件(watchdog),否则轮询
+
+    编辑器保存时往往产生多个事件,同一路径在debounce秒内只回调一次.
+    """
+
+    def __init__(self, interval=1.0, debounce=0.3):
+        self.interval = interval
+        self.debounce = debounce
+        self.watches = []  # (绝对路径, 是否目录, 回调, 后缀, 是否递归)
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.observer = None
+
+    def watch(self, path, callback, suffixes=(".py",), recursive=False):
+        """path为文件或目录,目录下指定后缀的文件变化时以文件路径回调"""
+        path = os.path.abspath(path)
+        self.watches.append((path, os.path.isdir(path), callback, tuple(suffixes), recursive))
+
+    def notify(self, path):
+        path = os.path.abspath(path)
+        for watched, is_dir, callback, suffixes, recursive in self.watches:
+            if is_dir:
+                inside = path.startswith(watched + os.sep) if recursive else os.path.dirname(path) == watched
+                matched = inside and path.lower().endswith(suffixes)
+            else:
+                matched = path == watched
+            if matched:
+                self.schedule(path, callback)
+
+    def schedule(self, path, callback):
+        with self.lock:
+            timer = self.timers.pop(path, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self.fire, args=(path, callback))
+            timer.daemon = True
+            self.timers[path] = timer
+            timer.start()
+
+    def fire(self, path, callback):
+        with self.lock:
+            self.timers.pop(path, None)
+        try:
+            callback(path)
+        except Exception as e:
+            logging.error(f"处理文件变化失败:{path}:{e}")
+
+    def start(self):
+        if Observer is not None:
+            self.observer = Observer()
+            handler = EventHandler(self)
+            directories = {}
+            for path, is_dir, _, _, recursive in self.watches:
+                directory = path if is_dir else os.path.dirname(path)
+                directories[directory] = directories.get(directory, False) or recursive
+            for directory, recursive in directories.items():
+                self.observer.schedule(handler, directory, recursive=recursive)
+            self.observer.daemon = True
+            self.observer.start()
+            logging.info("文件监视已启动(系统事件)")
+        else:
+            # 在start返回前取得初始快照,之后的修改都能被发现
+            threading.Thread(target=self.poll, args=(self.snapshot(),), daemon=True).start()
+            logging.info(f"文件监视已启动(每{self.interval}s轮询)")
+
+    def snapshot(self):
+        mtimes = {}
+        for path, is_dir, _, _, recursive in self.watches:
+            if not is_dir:
+                files = [path]
+            elif recursive:
+                files = [os.path.join(root, f) for root, _, names in os.walk(path) for f in names]
+            else:
+                files = [os.path.join(path, f) for f in os.listdir(path)]
+            for file in files:
+                try:
+                    mtimes[file] = os.stat(file).st_mtime_ns
+                except OSError:
+                    pass
+        return mtimes
+
+    def poll(self, last):
+        while not self.stopped.wait(self.interval):
+            current = self.snapshot()
+            for path in current.keys() | last.keys():
+                if current.get(path) != last.get(path):
+                    self.notify(path)
+            last = current
+
+    def stop(self):
+        self.stopped.set()
+        if self.observer is not None:
+            self.observer.stop()
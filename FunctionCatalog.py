@@ -0,0 +1,134 @@
+import re
+import inspect
+import logging
+from IntentRouter import normalize
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+default_config = {
+    "enabled": True,
+    "top_functions": 8,
+    "top_items": 15,
+    "min_score": 0.2,  # 最相关函数低于该得分时发送完整目录
+    "min_item_score": 0.5,
+}
+
+cjk_pattern = re.compile(r"[一-鿿]")
+
+
+def estimate_tokens(text):
+    """粗略估计token数:汉字约1个token,其他字符约4个一token"""
+    cjk = len(cjk_pattern.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def syllables(text):
+    if lazy_pinyin is None:
+        return list(text)
+    return lazy_pinyin(text)
+
+
+def bigrams(items):
+    return {a + " " + b for a, b in zip(items, items[1:])} or set(items)
+
+
+def overlap(query, target):
+    """query的字二元组和拼音二元组在target中出现的比例,取较大者"""
+    if not query:
+        return 0
+    lexical = len(bigrams(list(query)) & bigrams(list(target))) / len(bigrams(list(query)))
+    q, t = syllables(query), syllables(target)
+    phonetic = len(bigrams(q) & bigrams(t)) / len(bigrams(q))
+    return max(lexical, phonetic)
+
+
+def item_score(text, item):
+    """短名称(如程序名)与输入的匹配度"""
+    if not item:
+        return 0
+    if item in text:
+        return 1
+    if " ".join(syllables(item)) in " ".join(syllables(text)):
+        return 0.9
+    return overlap(item, text)
+
+
+class FunctionCatalog:
+    """注册时建立函数/程序目录,每次请求只为提示词挑选相关的部分"""
+
+    def __init__(self, config):
+        self.config = {**default_config, **config.get("catalog", {})}
+        self.triggers = config.get("intent", {}).get("triggers", {})
+        self.functions = []  # (名称, 渲染文本, 检索文本, 模块)
+        self.groups = []  # (标题, [条目], 模块)
+        self.parts = []  # (模块, 原始文本),按注册顺序拼出完整目录
+
+    @property
+    def full(self):
+        return "".join(text for _, text in self.parts)
+
+    def add_function(self, function):
+        name = function.__name__
+        rendered = f"def {name}{inspect.signature(function)}\n作用:{function.__doc__}\n"
+        keywords = " ".join([name.replace("_", " "), function.__doc__ or ""] + self.triggers.get(name, []))
+        self.functions.append((name, rendered, normalize(keywords), function.__module__))
+        self.parts.append((function.__module__, rendered))
+
+    def add_extra(self, extra, module=None):
+        """模块init返回的附加文本,首行为标题,其余每行为一个条目"""
+        if not extra:
+            return
+        self.parts.append((module, extra))
+        lines = extra.splitlines()
+        if len(lines) > 1:
+            items = dict.fromkeys(line for line in lines[1:] if line.strip())
+            self.groups.append((lines[0], list(items), module))
+        else:
+            self.groups.append((extra, [], module))
+
+    def remove_module(self, module):
+        """模块重新加载前移除它注册的函数和附加文本"""
+        self.functions = [entry for entry in self.functions if entry[3] != module]
+        self.groups = [group for group in self.groups if group[2] != module]
+        self.parts = [part for part in self.parts if part[0] != module]
+
+    def render(self, text=None):
+        """返回提示词中的函数部分,text为None时返回完整目录"""
+        if text is None or not self.config["enabled"]:
+            return self.full
+        query = normalize(text)
+
+        scored = sorted(
+            ((overlap(query, keywords), i) for i, (_, _, keywords, _) in enumerate(self.functions)),
+            reverse=True,
+        )
+        if not scored or scored[0][0] < self.config["min_score"]:
+            logging.info("函数目录:没有足够相关的函数,使用完整目录")
+            return self.full
+        chosen = sorted(i for score, i in scored[: self.config["top_functions"]] if score > 0)
+        result = "".join(self.functions[i][1] for i in chosen)
+
+        item_count = total_items = 0
+        for title, items, _ in self.groups:
+            total_items += len(items)
+            if not items:
+                result += title
+                continue
+            ranked = sorted(((item_score(query, normalize(item)), item) for item in items), reverse=True)
+            picked = [
+                item for score, item in ranked[: self.config["top_items"]]
+                if score >= self.config["min_item_score"]
+            ]
+            if picked:
+                item_count += len(picked)
+                result += title + "\n" + "".join(f"{item}\n" for item in picked)
+
+        saved = estimate_tokens(self.full) - estimate_tokens(result)
+        logging.info(
+            f"函数目录:选用{len(chosen)}/{len(self.functions)}个函数,"
+            f"{item_count}/{total_items}个条目,节省约{saved} tokens"
+        )
+        return result
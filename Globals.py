@@ -1,15 +1,19 @@
-tray = None
-icon = None
-text = None
-caller = None
-hotkey = "f8"
-config = None
-reponse = None
-log_path = None
-modified = False
-controller = None
-always_ask = True
-text_handler = None
-is_recording = False
-speech_service = None
+tray = None
+icon = None
+text = None
+caller = None
+hotkey = "f8"
+config = None
+reponse = None
+router = None
+pipeline = None
+watcher = None
+plugins = None
+executor = None
+log_path = None
+controller = None
+always_ask = True
+text_handler = None
+is_recording = False
+speech_service = None
 reponse_handler = None
\ No newline at end of file
@@ -0,0 +1,200 @@
+import re
+import sys
+import ast
+import math
+import time
+import inspect
+import logging
+import unicodedata
+from difflib import SequenceMatcher
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+default_config = {
+    "enabled": True,
+    "threshold": 0.85,
+    "max_slot_length": 8,
+    "triggers": {},
+}
+
+# 带参数的触发短语匹配面更宽,降低其得分以免抢占无参短语
+slot_weight = 0.9
+# 无法校验的字符串参数(模块没有提供打分函数)的最高得分,低于默认阈值,交给LLM判断
+unverified_weight = 0.8
+slot_pattern = re.compile(r"\{(\w+)\}")
+# 含否定词或疑问语气的话与触发短语读音相近时意思往往相反,不在本地执行,交给LLM理解
+negation_words = ("别", "不要", "不", "没")
+question_words = ("吗", "呢", "?")
+
+
+def normalize(text):
+    """全角转半角,去除空白和标点(保留小数点),统一小写"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(
+        ch for ch in text
+        if ch == "." or (not ch.isspace() and unicodedata.category(ch)[0] not in "PS")
+    )
+    return text.strip(".")
+
+
+def to_pinyin(text):
+    """转为拼音以吸收同音字识别错误,未安装pypinyin时按原文比较"""
+    if lazy_pinyin is None:
+        return text
+    return " ".join(lazy_pinyin(text))
+
+
+def is_directive(text):
+    """text为未经normalize的原文,不含否定词和疑问语气时才可能是直接的命令"""
+    text = unicodedata.normalize("NFKC", text)
+    return not any(word in text for word in negation_words + question_words)
+
+
+def similarity(a, b):
+    return SequenceMatcher(None, to_pinyin(a), to_pinyin(b)).ratio()
+
+
+def param_type(param):
+    """参数的类型:int,float或str.按注解判断,没有注解时按默认值判断
+
+    占位函数的注解和默认值是原样显示的文本(PluginLoader.Text)
+    """
+    annotation = param.annotation
+    if annotation in (int, float):
+        return annotation
+    name = getattr(annotation, "text", annotation)
+    if name in ("int", "float"):
+        return {"int": int, "float": float}[name]
+    default = param.default
+    if hasattr(default, "text"):
+        try:
+            default = ast.literal_eval(default.text)
+        except (ValueError, SyntaxError):
+            return str
+    if isinstance(default, (int, float)) and not isinstance(default, bool):
+        return type(default)
+    return str
+
+
+def convert(value, type_):
+    """按参数类型转换提取出的值,数字参数无法转换(或为inf,nan)时返回None"""
+    if type_ is str:
+        return value
+    try:
+        number = type_(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def slot_scorer(function, slot):
+    """模块可以定义SLOT_SCORES = {函数名: {参数名: fn(值) -> 0~1}},为提取出的参数值打分
+
+    模块尚未导入(仍是占位函数)时没有打分函数
+    """
+    module = sys.modules.get(function.__module__)
+    return getattr(module, "SLOT_SCORES", {}).get(function.__name__, {}).get(slot)
+
+
+class Trigger:
+    def __init__(self, function, phrase):
+        self.function = function
+        self.phrase = phrase
+        match = slot_pattern.search(phrase)
+        self.slot = match.group(1) if match else None
+        self.slot_type = str
+        if self.slot:
+            self.prefix = normalize(phrase[: match.start()])
+            self.suffix = normalize(phrase[match.end() :])
+        else:
+            self.prefix = normalize(phrase)
+            self.suffix = ""
+
+    def match(self, text, max_slot_length):
+        """返回(得分, 参数字典)"""
+        if self.slot is None:
+            # 模糊匹配只用于吸收同音字,多出的文字可能是附加的要求
+            if len(text) > len(self.prefix):
+                return 0, {}
+            return similarity(text, self.prefix), {}
+        value_len = len(text) - len(self.prefix) - len(self.suffix)
+        if not 0 < value_len <= max_slot_length:
+            return 0, {}
+        head, tail = text[: len(self.prefix)], text[len(text) - len(self.suffix) :]
+        value = convert(text[len(self.prefix) : len(text) - len(self.suffix)], self.slot_type)
+        if value is None:
+            return 0, {}
+        score = similarity(head + tail, self.prefix + self.suffix)
+        return score * self.value_score(value), {self.slot: value}
+
+    def value_score(self, value):
+        """参数值的可信度:数字已通过类型校验;字符串需要模块的打分函数确认"""
+        if self.slot_type is not str:
+            return slot_weight
+        scorer = slot_scorer(self.function, self.slot)
+        if scorer is None:
+            return unverified_weight
+        try:
+            return min(slot_weight, scorer(value))
+        except Exception as e:
+            logging.debug(f"参数打分失败:{self.function.__name__}({value!r}):{e}")
+            return 0
+
+
+class IntentRouter:
+    """本地意图匹配,足够确定时直接调用模块函数,跳过LLM"""
+
+    def __init__(self, config):
+        self.config = {**default_config, **config.get("intent", {})}
+        self.triggers = []
+        if lazy_pinyin is None:
+            logging.info("未安装pypinyin,本地意图匹配将不使用拼音比较")
+
+    def register(self, function):
+        """根据函数的注释和配置中的触发短语建立索引"""
+        if not self.config["enabled"]:
+            return
+        params = inspect.signature(function).parameters
+        phrases = list(self.config["triggers"].get(function.__name__, []))
+        if not params and function.__doc__:
+            phrases.append(function.__doc__.strip())
+        for phrase in phrases:
+            trigger = Trigger(function, phrase)
+            if trigger.slot and trigger.slot not in params:
+                logging.warning(f"触发短语'{phrase}'的参数不属于{function.__name__}")
+                continue
+            if trigger.slot:
+                trigger.slot_type = param_type(params[trigger.slot])
+            self.triggers.append(trigger)
+
+    def remove_module(self, module):
+        """模块重新加载前移除它注册的触发短语"""
+        self.triggers = [trigger for trigger in self.triggers if trigger.function.__module__ != module]
+
+    def match(self, text):
+        """返回可直接执行的调用代码,不够确定时返回None"""
+        if not self.config["enabled"] or not self.triggers or not text:
+            return None
+        stime = time.perf_counter()
+        if not is_directive(text):
+            logging.debug(f"本地意图跳过否定或疑问:{text}")
+            return None
+        text = normalize(text)
+        best_score, best_trigger, best_args = 0, None, None
+        for trigger in self.triggers:
+            score, args = trigger.match(text, self.config["max_slot_length"])
+            if score > best_score:
+                best_score, best_trigger, best_args = score, trigger, args
+        if best_score < self.config["threshold"]:
+            return None
+
+        args = ", ".join(f"{k}={v!r}" for k, v in best_args.items())
+        code = f"{best_trigger.function.__name__}({args})"
+        logging.info(
+            f"本地意图命中:{code},匹配短语:{best_trigger.phrase},"
+            f"得分:{best_score:.2f},耗时:{(time.perf_counter() - stime) * 1000:.1f}ms"
+        )
+        return code
@@ -1,68 +1,350 @@
-import requests
-import logging
-import time
-import copy
-import os
-
-url = None
-payload = None
-headers = None
-prompts_modify_time = 0
-Ndia = 0
-prompts_path = "prompts.txt"
-
-
-def init(config, funcs):
-    global payload, prompts_modify_time, headers, url, Ndia, prompts_path
-
-    url = config["url"]
-    prompts_path = config["system"]
-    Ndia = config["keep_dialog"]
-    payload = copy.deepcopy(config["payload"])
-
-    prompt = (
-        open(config["system"], encoding="utf-8").read().replace("{$functions}", funcs)
-    )
-    prompts_modify_time = os.path.getmtime(prompts_path)
-
-    payload["messages"].append({"role": "system", "content": prompt})
-    payload["model"] = config["models"][0]
-
-    headers = {
-        "Authorization": f"Bearer {config["key"]}",
-        "Content-Type": "application/json",
-    }
-
-    logging.info("LLM初始化完成,使用模型:" + config["models"][0])
-    logging.info(f"-URL:{url}")
-    logging.info(f"-API_KEY:{config['key'][:5] + '*' * (len(config['key']) - 8) + config['key'][-3:]}")
-
-
-def call_llm_api(prompt):
-    # 检查系统提示词是否有更新
-    global prompts_modify_time, payload, Ndia, prompts_path
-    if prompts_modify_time != os.path.getmtime(prompts_path):
-        prompts_modify_time = os.path.getmtime(prompts_path)
-        payload["messages"][0][
-            "content"
-        ] = f"{open(prompts_path, encoding='utf-8').read()}"
-
-    payload["messages"].append({"role": "user", "content": prompt})
-
-    # 发送请求并获取LLM的回答
-    stime = time.time()
-    response = requests.request("POST", url, json=payload, headers=headers)
-    etime = time.time()
-    content = response.json()["choices"][0]["message"]["content"]
-
-    payload["messages"].append({"role": "assistant", "content": content})
-
-    if len(payload["messages"]) > 1 + Ndia * 2:
-        new = [payload["messages"][0]] + payload["messages"][-Ndia * 2 :]
-        payload["messages"] = new
-
-    return content, etime - stime
-
-
-if __name__ == "__main__":
-    print(call_llm_api("打开连点"))
+import logging
+import json
+import time
+import copy
+import re
+import Tracing
+from Session import Session
+from ConnectionManager import ConnectionManager, AbortHandle
+from ResponseCache import ResponseCache, fingerprint
+from ModelRouter import ModelRouter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+url = None
+config = None  # 与主程序共享的配置,重新加载时原地更新
+payload = None
+headers = None
+connection = None
+cache = None
+router = None
+catalog = None
+template = ""
+system_prompt = ""  # 所有会话共享,只整体替换,不在原处修改
+default_session = None  # 不经过流水线的调用(如基准测试)使用的会话
+executor = ThreadPoolExecutor(max_workers=4)
+Ndia = 0
+prompts_path = "prompts.txt"
+
+# 会触发实际操作的代码块
+ACTION_TAGS = ("python", "powershell", "answer", "ambiguous")
+# 提示词中约定的全部代码块
+KNOWN_TAGS = ACTION_TAGS + ("note", "corrected")
+
+
+class BlockParser:
+    """增量解析```tag ...```代码块,每当代码块闭合时返回(tag, body)"""
+
+    fence = "```"
+    tag_pattern = re.compile(r"\w*")
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        blocks = []
+        while True:
+            start = self.buffer.find(self.fence)
+            if start == -1:
+                # 保留可能是半个围栏的结尾
+                self.buffer = self.buffer[-(len(self.fence) - 1):]
+                break
+            tag_start = start + len(self.fence)
+            tag = self.tag_pattern.match(self.buffer, tag_start).group()
+            tag_end = tag_start + len(tag)
+            if tag_end == len(self.buffer):
+                # 标签可能尚未接收完整
+                self.buffer = self.buffer[start:]
+                break
+            end = self.buffer.find(self.fence, tag_end)
+            if end == -1:
+                self.buffer = self.buffer[start:]
+                break
+            blocks.append((tag, self.buffer[tag_end:end].strip()))
+            self.buffer = self.buffer[end + len(self.fence):]
+        return blocks
+
+
+def init(_config, function_catalog):
+    global payload, headers, url, Ndia, prompts_path, connection, cache, router
+    global catalog, template, system_prompt, default_session, config
+
+    config = _config
+    url = config["url"]
+    prompts_path = config["system"]
+    Ndia = config["keep_dialog"]
+    payload = copy.deepcopy(config["payload"])
+    # 对话历史保存在各会话中,payload只作为请求参数的模板
+    payload.pop("messages", None)
+    catalog = function_catalog
+    default_session = Session("default", Ndia)
+
+    template = open(config["system"], encoding="utf-8").read()
+    prompt = template.replace("{$functions}", catalog.render())
+
+    system_prompt = prompt
+    payload["model"] = config["models"][0]
+
+    headers = {
+        "Authorization": f"Bearer {config["key"]}",
+        "Content-Type": "application/json",
+    }
+
+    logging.info("LLM初始化完成,使用模型:" + config["models"][0])
+    logging.info(f"-URL:{url}")
+    logging.info(f"-API_KEY:{config['key'][:5] + '*' * (len(config['key']) - 8) + config['key'][-3:]}")
+    logging.info(f"-流式输出:{'开启' if payload.get('stream') else '关闭'}")
+
+    connection = ConnectionManager(url, config)
+    connection.start()
+
+    router = ModelRouter(config)
+
+    cache = ResponseCache(config)
+    cache.validate(fingerprint(prompt, *config["models"]))
+
+
+def reload_prompts():
+    """重新读取系统提示词并渲染函数目录,由文件监视线程在变化时调用,请求路径不访问文件"""
+    global template, system_prompt
+    new_template = open(prompts_path, encoding="utf-8").read()
+    prompt = new_template.replace("{$functions}", catalog.render())
+    # 两次赋值均为原子操作,请求线程只会看到完整的旧值或新值
+    template = new_template
+    system_prompt = prompt
+    cache.validate(fingerprint(prompt, *config["models"]))
+    logging.info("系统提示词已重新加载")
+
+
+def is_malformed(content):
+    """回答中没有任何可识别的代码块"""
+    return not any(tag in KNOWN_TAGS for tag, _ in BlockParser().feed(content))
+
+
+def render_system(prompt):
+    """只包含与本次输入相关的函数的系统提示词"""
+    return template.replace("{$functions}", catalog.render(prompt))
+
+
+def build_payload(model, history, system=None):
+    """history为会话历史的快照,system为None时使用完整目录的系统提示词"""
+    messages = [{"role": "system", "content": system if system is not None else system_prompt}]
+    return {**payload, "model": model, "messages": messages + history}
+
+
+def request(model, history, system=None, abort=None):
+    """用指定模型请求对话,返回(回答, 模型).abort为AbortHandle时可从其他线程中止"""
+    stime = time.perf_counter()
+    response = connection.post(url, json=build_payload(model, history, system), headers=headers, abort=abort)
+    response.raise_for_status()
+    data = response.json()
+    router.record(model, time.perf_counter() - stime, data.get("usage") or {})
+    Tracing.observe("llm", model, time.perf_counter() - stime)
+    return data["choices"][0]["message"]["content"], model
+
+
+def hedged_request(model, history, system=None, abort=None):
+    """大模型超过延迟预算时,同时请求小模型,先返回者胜出"""
+    backup = router.other(model)
+    if not (router.config["hedge"] and model == router.large and backup):
+        return request(model, history, system, abort)
+
+    first = executor.submit(request, model, history, system, abort)
+    try:
+        return first.result(timeout=router.config["latency_budget"])
+    except TimeoutError:
+        logging.info(f"{model}超过延迟预算{router.config['latency_budget']}s,对冲到{backup}")
+    second = executor.submit(request, backup, history, system, abort)
+    error = None
+    for future in as_completed([first, second]):
+        try:
+            return future.result()
+        except Exception as e:
+            error = e
+            logging.error(f"请求失败:{e}")
+    raise error
+
+
+def retry_malformed(content, model, history, system=None, abort=None):
+    """回答格式不正确时换另一个模型重试"""
+    other = router.other(model)
+    if not (router.config["retry_on_malformed"] and other and is_malformed(content)):
+        return content, model
+    logging.warning(f"{model}的回答中没有可识别的代码块,改用{other}重试")
+    return request(other, history, system, abort)
+
+
+def retry_full_catalog(content, model, history, system, abort=None):
+    """模型无法确定时,改用完整函数目录重试"""
+    if system is None or "```ambiguous" not in content:
+        return content, model
+    logging.info("模型回答不明确,使用完整函数目录重试")
+    return request(model, history, abort=abort)
+
+
+def session_of(ctx):
+    return ctx.session if ctx is not None and ctx.session is not None else default_session
+
+
+def cache_get(prompt, history):
+    """会话中已有对话时,同一句话的含义可能依赖上文,不使用缓存"""
+    if len(history) > 1:
+        return None
+    cached = cache.get(prompt)
+    if cached is not None:
+        Tracing.annotate(cached=True, model=cached[1])
+    return cached
+
+
+def cache_put(prompt, history, content, model):
+    if len(history) == 1:
+        cache.put(prompt, content, model)
+
+
+def call_llm_api(prompt, ctx=None):
+    """ctx为流水线的请求上下文,决定使用的会话,被取消时中止进行中的请求"""
+    session = session_of(ctx)
+    message, history = session.begin(prompt)
+
+    stime = time.perf_counter()
+    cached = cache_get(prompt, history)
+    if cached is not None:
+        content = cached[0]
+        session.commit(content)
+        return content, time.perf_counter() - stime
+
+    # 发送请求并获取LLM的回答
+    model, reason = router.route(prompt)
+    logging.info(f"路由到模型{model},原因:{reason}")
+    system = render_system(prompt)
+    # 发出请求前注册中止回调,取消时关闭进行中的连接
+    abort = AbortHandle()
+    if ctx is not None:
+        ctx.on_cancel(abort.abort)
+    try:
+        content, model = retry_malformed(*hedged_request(model, history, system, abort), history, system, abort)
+        content, model = retry_full_catalog(content, model, history, system, abort)
+    except Exception:
+        # 取消时连接被关闭,请求会抛出异常
+        if ctx is None or not ctx.cancelled:
+            raise
+        content = ""
+    etime = time.perf_counter()
+    if ctx is not None and ctx.cancelled:
+        session.discard(message)
+        logging.info("LLM请求已中止")
+        return content, etime - stime
+    Tracing.annotate(model=model, route=reason)
+
+    session.commit(content)
+    cache_put(prompt, history, content, model)
+
+    return content, etime - stime
+
+
+def call_llm_api_stream(prompt, on_block, ctx=None):
+    """流式调用LLM,每个代码块闭合时立即调用on_block(tag, body).ctx被取消时中止连接"""
+    session = session_of(ctx)
+    message, history = session.begin(prompt)
+
+    stime = time.perf_counter()
+    cached = cache_get(prompt, history)
+    if cached is not None:
+        content = cached[0]
+        for tag, body in BlockParser().feed(content):
+            on_block(tag, body)
+        session.commit(content)
+        return content, time.perf_counter() - stime
+
+    parser = BlockParser()
+    content = ""
+    first_token, first_action = None, None
+    dispatched = False
+    usage = {}
+    parse_time = 0.0
+
+    model, reason = router.route(prompt)
+    logging.info(f"路由到模型{model},原因:{reason}(流式)")
+    system = render_system(prompt)
+    # 发出请求前注册中止回调,取消时关闭进行中的连接(包括尚未返回响应头的连接)
+    abort = AbortHandle()
+    if ctx is not None:
+        ctx.on_cancel(abort.abort)
+    response = None
+    try:
+        response = connection.post(
+            url,
+            json={**build_payload(model, history, system), "stream": True},
+            headers=headers,
+            stream=True,
+            abort=abort,
+        )
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            usage = chunk.get("usage") or usage
+            choices = chunk.get("choices")
+            if not choices:
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - stime
+            content += delta
+            parse_start = time.perf_counter()
+            blocks = parser.feed(delta)
+            parse_time += time.perf_counter() - parse_start
+            for tag, body in blocks:
+                if first_action is None and tag in ACTION_TAGS:
+                    first_action = time.perf_counter() - stime
+                dispatched = True
+                on_block(tag, body)
+    except Exception:
+        # 取消时连接被关闭,连接或读取会抛出异常
+        if ctx is None or not ctx.cancelled:
+            raise
+    finally:
+        if response is not None:
+            response.close()
+        abort.release()
+    if ctx is not None and ctx.cancelled:
+        session.discard(message)
+        logging.info("LLM请求已中止")
+        return content, time.perf_counter() - stime
+    router.record(model, time.perf_counter() - stime, usage)
+    Tracing.observe("llm", model, time.perf_counter() - stime)
+
+    if not dispatched:
+        # 尚未执行任何代码块,可以安全地换模型重试
+        content, model = retry_malformed(content, model, history, system, abort)
+        for tag, body in BlockParser().feed(content):
+            on_block(tag, body)
+    etime = time.perf_counter()
+
+    session.commit(content)
+    cache_put(prompt, history, content, model)
+
+    # 解析分散在流式接收过程中,记录为累计耗时
+    llm_span = Tracing.current()
+    if llm_span is not None:
+        llm_span.child("parse", etime - parse_time).finish(etime)
+    Tracing.annotate(
+        model=model, route=reason,
+        ttft_ms=round((first_token or 0) * 1000), ttfa_ms=round((first_action or 0) * 1000),
+    )
+    logging.info(
+        f"首个token耗时:{first_token or 0:.2f}s,"
+        f"首个动作耗时:{first_action or 0:.2f}s"
+    )
+    return content, etime - stime
+
+
+if __name__ == "__main__":
+    print(call_llm_api("打开连点"))
@@ -0,0 +1,71 @@
+import os
+import queue
+import logging
+import logging.handlers
+
+default_config = {
+    "scrollback": 5000,  # 命令窗口最多保留的行数
+    "tail_lines": 500,  # 打开命令窗口时从日志文件加载的行数
+    "flush_ms": 33,  # 命令窗口合并刷新的间隔
+}
+
+log_format = "%(asctime)s - %(levelname)s - %(message)s"
+
+listener = None
+
+
+def setup(log_path, level=logging.INFO):
+    """日志记录只入队,由监听线程写文件和控制台,音频回调、键盘钩子等线程不会被IO阻塞"""
+    global listener
+    formatter = logging.Formatter(log_format)
+    handlers = [logging.FileHandler(log_path, encoding="utf-8"), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def add_handler(handler):
+    """在监听线程中追加输出(如命令窗口)"""
+    if listener is None:
+        logging.getLogger().addHandler(handler)
+    else:
+        listener.handlers = listener.handlers + (handler,)
+
+
+def remove_handler(handler):
+    if listener is None:
+        logging.getLogger().removeHandler(handler)
+    else:
+        listener.handlers = tuple(h for h in listener.handlers if h is not handler)
+
+
+def stop():
+    """写完队列中剩余的日志"""
+    if listener is not None:
+        listener.stop()
+
+
+def tail(path, lines=500, block_size=64 * 1024):
+    """从文件末尾向前按块读取,只返回最后lines行,不读入整个日志"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        data = b""
+        while pos > 0 and data.count(b"\n") <= lines:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size) + data
+    text = data.decode("utf-8", errors="replace").rstrip("\n")
+    return "\n".join(text.split("\n")[-lines:]) if lines else ""
@@ -0,0 +1,278 @@
+"""本地替身服务,用于离线测试
+
+python MockServer.py asr --port 8765 --text 打开连点
+然后将speech_services中的realtime_url设为ws://127.0.0.1:8765
+
+python MockServer.py llm --port 8766 --latency 0.3
+然后将url设为http://127.0.0.1:8766/v1/chat/completions
+"""
+import json
+import time
+import random
+import base64
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# RFC 6455 第1.3节规定的固定GUID
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def ws_accept(key):
+    """由客户端的Sec-WebSocket-Key计算Sec-WebSocket-Accept
+
+    RFC 6455中的示例:dGhlIHNhbXBsZSBub25jZQ== -> s3pPLMBiTxaQ9kYGzzhZRbK+xOo=
+    """
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def ws_handshake(rfile, wfile):
+    """完成WebSocket握手,返回请求路径"""
+    request_line = rfile.readline().decode("latin-1").strip()
+    headers = {}
+    while True:
+        line = rfile.readline().decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    accept = ws_accept(headers["sec-websocket-key"])
+    wfile.write(
+        (
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode()
+    )
+    wfile.flush()
+    return request_line.split(" ")[1]
+
+
+def ws_recv(rfile):
+    """读取一帧,返回(opcode, payload)"""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return 0x8, b""
+    opcode, length = head[0] & 0x0F, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+    payload = bytearray(rfile.read(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def ws_send(wfile, payload, opcode=0x1):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    length = len(payload)
+    if length < 126:
+        head = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 65536:
+        head = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    wfile.write(head + payload)
+    wfile.flush()
+
+
+class RealtimeASRHandler(socketserver.StreamRequestHandler):
+    """按百度实时识别协议应答:收到音频时返回MID_TEXT,收到FINISH后返回FIN_TEXT"""
+
+    def handle(self):
+        server = self.server
+        ws_handshake(self.rfile, self.wfile)
+        received = 0
+        while True:
+            opcode, payload = ws_recv(self.rfile)
+            if opcode == 0x8:
+                break
+            if opcode == 0x2:
+                received += len(payload)
+                # 按收到的音频长度逐步"识别"出更多文字
+                seconds = received / (server.sample_rate * 2)
+                count = min(len(server.text), int(seconds / server.seconds_per_char) + 1)
+                self.send_result("MID_TEXT", server.text[:count])
+            elif opcode == 0x1:
+                message = json.loads(payload)
+                if message.get("type") == "FINISH":
+                    time.sleep(server.final_delay)
+                    if server.fail or random.random() < server.error_rate:
+                        self.send_result("FIN_TEXT", "", err_no=-3005)
+                    else:
+                        self.send_result("FIN_TEXT", server.text)
+                    ws_send(self.wfile, b"", opcode=0x8)
+                    break
+        logging.info(f"ASR替身服务:本次收到{received}字节音频")
+
+    def send_result(self, type_, result, err_no=0):
+        ws_send(
+            self.wfile,
+            json.dumps({"type": type_, "err_no": err_no, "result": result}, ensure_ascii=False),
+        )
+
+
+class RealtimeASRServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, text="打开连点", final_delay=0.05, fail=False, error_rate=0):
+        super().__init__(address, RealtimeASRHandler)
+        self.text = text
+        self.final_delay = final_delay
+        self.fail = fail
+        self.error_rate = error_rate
+        self.sample_rate = 16000
+        self.seconds_per_char = 0.25
+
+    def start(self):
+        """在后台线程中运行,返回服务地址"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return f"ws://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """按OpenAI chat/completions协议应答,支持流式输出"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和正文分两次写入,关闭Nagle算法以免与延迟确认叠加出40ms的额外延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        # 连接预热
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with server.lock:
+            server.requests += 1
+        prompt = next(
+            (m["content"] for m in reversed(request.get("messages", [])) if m["role"] == "user"), ""
+        )
+        time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0))
+        if random.random() < server.error_rate:
+            self.send_json(500, {"error": {"message": "注入的错误"}})
+            return
+        content = server.reply(prompt)
+        usage = {"prompt_tokens": sum(len(m["content"]) for m in request.get("messages", [])),
+                 "completion_tokens": len(content)}
+        if request.get("stream"):
+            self.send_stream(request.get("model", ""), content, usage)
+        else:
+            self.send_json(200, {
+                "model": request.get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, model, content, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        server = self.server
+        size = server.chunk_size
+        for i in range(0, len(content), size):
+            delta = {"choices": [{"index": 0, "delta": {"content": content[i:i + size]}}], "model": model}
+            self.send_chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+            time.sleep(server.token_delay)
+        self.send_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+        self.send_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class ChatServer(ThreadingHTTPServer):
+    """LLM替身服务:可配置延迟、抖动、流式输出速度和错误率
+
+    replies为{关键词: 回答},用户输入包含关键词时返回对应回答,否则返回default
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, replies=None, default="```python\nstart_autoclick()\n```",
+                 latency=0.2, jitter=0, token_delay=0.01, chunk_size=4, error_rate=0):
+        super().__init__(address, ChatHandler)
+        self.replies = replies or {}
+        self.default = default
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay  # 流式输出时每个分块的间隔
+        self.chunk_size = chunk_size  # 流式输出时每个分块的字符数
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def reply(self, prompt):
+        for keyword, content in self.replies.items():
+            if keyword in prompt:
+                return content
+        return self.default
+
+    def start(self):
+        """在后台线程中运行,返回chat/completions地址"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1/chat/completions"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spassit本地替身服务")
+    parser.add_argument("service", choices=["asr", "llm"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--text", default="打开连点", help="识别结果")
+    parser.add_argument("--delay", type=float, default=0.05, help="FINISH后返回结果的延迟(秒)")
+    parser.add_argument("--fail", action="store_true", help="返回识别错误")
+    parser.add_argument("--reply", default="```python\nstart_autoclick()\n```", help="LLM的回答")
+    parser.add_argument("--latency", type=float, default=0.2, help="LLM首个分块前的延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0, help="LLM延迟的随机波动(秒)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="流式输出的分块间隔(秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="随机返回错误的概率")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.service == "asr":
+        server = RealtimeASRServer(
+            (args.host, args.port), args.text, args.delay, args.fail, args.error_rate
+        )
+        logging.info(f"ASR替身服务已启动:ws://{args.host}:{args.port}")
+    else:
+        server = ChatServer(
+            (args.host, args.port), default=args.reply, latency=args.latency, jitter=args.jitter,
+            token_delay=args.token_delay, error_rate=args.error_rate,
+        )
+        logging.info(f"LLM替身服务已启动:http://{args.host}:{args.port}/v1/chat/completions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import re
+import logging
+import threading
+from collections import defaultdict
+
+default_config = {
+    "enabled": True,
+    "large": 0,  # models中大模型的下标
+    "small": 1,  # models中小模型的下标
+    "short_length": 12,  # 不超过该长度的命令式输入交给小模型
+    "retry_on_malformed": True,
+    "hedge": False,
+    "latency_budget": 4.0,  # 大模型超过该耗时后对冲到小模型
+}
+
+# 提问或多步骤任务的特征
+question_pattern = re.compile(r"[?？]|吗|呢|什么|怎么|怎样|为什么|如何|多少|哪|是否|解释|介绍")
+multistep_pattern = re.compile(r"然后|并且|接着|之后|同时|再|[,，;；。]")
+
+
+class ModelRouter:
+    """按输入的类型在大小模型之间路由,并统计各模型的耗时和token用量"""
+
+    def __init__(self, config):
+        self.config = {**default_config, **config.get("routing", {})}
+        models = config["models"]
+        self.large = models[self.config["large"]]
+        self.small = models[self.config["small"]] if len(models) > self.config["small"] else None
+        self.enabled = self.config["enabled"] and self.small is not None
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {"calls": 0, "time": 0.0, "prompt": 0, "completion": 0})
+        if self.enabled:
+            logging.info(f"-模型路由:命令->{self.small},提问/多步骤->{self.large}")
+
+    def route(self, text):
+        """返回(模型, 原因)"""
+        if not self.enabled:
+            return self.large, "未启用路由"
+        if question_pattern.search(text):
+            return self.large, "提问"
+        if multistep_pattern.search(text.strip("。.!！ ")):
+            return self.large, "多步骤"
+        if len(text) > self.config["short_length"]:
+            return self.large, "长输入"
+        return self.small, "短命令"
+
+    def other(self, model):
+        """返回另一个模型,用于重试和对冲"""
+        if not self.enabled:
+            return None
+        return self.small if model == self.large else self.large
+
+    def record(self, model, elapsed, usage):
+        with self.lock:
+            stats = self.stats[model]
+            stats["calls"] += 1
+            stats["time"] += elapsed
+            stats["prompt"] += usage.get("prompt_tokens", 0)
+            stats["completion"] += usage.get("completion_tokens", 0)
+            logging.info(
+                f"模型{model}:耗时{elapsed:.2f}s,"
+                f"tokens {usage.get('prompt_tokens', 0)}+{usage.get('completion_tokens', 0)};"
+                f"累计{stats['calls']}次,平均{stats['time'] / stats['calls']:.2f}s,"
+                f"tokens {stats['prompt']}+{stats['completion']}"
+            )
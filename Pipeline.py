@@ -0,0 +1,193 @@
+import time
+import logging
+import itertools
+import threading
+import Tracing
+import Session
+from concurrent.futures import Future, ThreadPoolExecutor
+
+default_config = {
+    # 各阶段超时(秒),null表示不限
+    "timeouts": {
+        "capture": 5,
+        "asr": 15,
+        "llm": 90,
+        "execute": None,
+    },
+}
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RequestContext:
+    """一次语音或文本命令的上下文,各阶段的输入输出都记录在这里"""
+
+    ids = itertools.count(1)
+
+    def __init__(self, source, text=None):
+        self.id = next(self.ids)
+        self.source = source  # "voice"或"cli"
+        self.text = text
+        self.session = None  # 提交时按来源分配,决定对话历史和执行顺序
+        self.audio = None
+        self.response = None
+        self.deferred = None  # 流式处理时推迟到执行阶段的代码块
+        self.jobs = []  # 已提交的代码执行任务
+        self.stage = None
+        self.reason = None
+        self.created = time.perf_counter()
+        self.trace = Tracing.Span(source, start=self.created)  # 各阶段为其子span
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self, reason):
+        """取消请求,并执行已注册的中止回调(如关闭进行中的HTTP连接)"""
+        with self.lock:
+            if self.cancel_event.is_set():
+                return
+            self.reason = reason
+            self.cancel_event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.debug(f"中止回调失败:{e}")
+
+    def on_cancel(self, callback):
+        """注册中止回调,已取消时立即执行"""
+        with self.lock:
+            if not self.cancel_event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+
+class Pipeline:
+    """在工作线程中按阶段执行请求
+
+    不同会话的请求并发执行,同一会话的请求按提交顺序执行;
+    新的语音输入会取代进行中的语音请求.
+    """
+
+    def __init__(self, config, on_finish=None):
+        self.config = {**default_config, **config.get("pipeline", {})}
+        self.timeouts = {**default_config["timeouts"], **self.config["timeouts"]}
+        self.on_finish = on_finish
+        workers = {**Session.default_config, **config.get("sessions", {})}["workers"]
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self.sessions = Session.SessionManager(config, self.executor)
+        self.current = None  # 进行中的语音请求
+        self.lock = threading.Lock()
+
+    def cancel_current(self, reason):
+        with self.lock:
+            current, self.current = self.current, None
+        if current is not None:
+            current.cancel(reason)
+
+    def submit(self, ctx, stages, supersede=False, before=()):
+        """stages为[(阶段名, fn(ctx))],立即返回.supersede为True时取代进行中的语音请求
+
+        before中的阶段(如语音识别)不依赖对话历史,立即在独立线程中执行,
+        因此语音请求不会因为同一会话中进行中的命令而推迟识别.
+        请求提交时即在会话队列中占位,排到后等待before完成再执行stages,
+        之后提交的命令不会因为识别较慢而先执行.
+        """
+        if ctx.session is None:
+            ctx.session = self.sessions.for_source(ctx.source)
+        if supersede:
+            self.cancel_current(f"被请求#{ctx.id}取代")
+            with self.lock:
+                self.current = ctx
+        prepared = None
+        if before:
+            prepared = Future()
+            threading.Thread(
+                target=self.prepare, args=(ctx, before, prepared),
+                name=f"request#{ctx.id}", daemon=True,
+            ).start()
+        self.sessions.submit(ctx.session, lambda waited: self.run(ctx, stages, waited, prepared))
+        return ctx
+
+    def prepare(self, ctx, stages, prepared):
+        """执行before阶段,结果(或异常)交给会话队列中的占位任务处理"""
+        try:
+            self.run_stages(ctx, stages)
+        except BaseException as e:
+            prepared.set_exception(e)
+        else:
+            prepared.set_result(None)
+
+    def run_stage(self, ctx, name, stage):
+        """在独立线程中执行阶段,超时则取消请求;被放弃的阶段在后台自行结束"""
+        result = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                with ctx.trace.child(name):
+                    stage(ctx)
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name=f"{name}#{ctx.id}", daemon=True).start()
+        # 被取代时不必等待阶段结束
+        ctx.on_cancel(done.set)
+        timeout = self.timeouts.get(name)
+        if not done.wait(timeout):
+            ctx.cancel(f"{name}阶段超时({timeout}s)")
+        ctx.check()
+        if "error" in result:
+            raise result["error"]
+
+    def run_stages(self, ctx, stages):
+        for name, stage in stages:
+            ctx.check()
+            ctx.stage = name
+            self.run_stage(ctx, name, stage)
+
+    def run(self, ctx, stages, waited=0.0, prepared=None):
+        """prepared为before阶段的Future,不为None时先等待其完成"""
+        stime = time.perf_counter()
+        if waited:
+            # 在会话队列中等待前面的请求
+            ctx.trace.child("queue", stime - waited, session=ctx.session.name).finish(stime)
+        try:
+            if prepared is not None:
+                prepared.result()
+            self.run_stages(ctx, stages)
+            logging.info(f"请求#{ctx.id}完成,总耗时:{time.perf_counter() - ctx.created:.2f}s")
+        except Cancelled:
+            logging.info(f"请求#{ctx.id}已取消({ctx.stage}阶段):{ctx.reason}")
+        except Exception as e:
+            logging.error(f"请求#{ctx.id}在{ctx.stage}阶段失败:{e}")
+        finally:
+            self.finish(ctx)
+
+    def finish(self, ctx):
+        """结束请求:导出追踪记录,通知界面"""
+        status = "cancelled" if ctx.cancelled else "done"
+        ctx.trace.finish(status=status)
+        Tracing.export(ctx.trace, id=ctx.id, text=ctx.text, session=ctx.session.name)
+        with self.lock:
+            is_current = self.current is ctx
+            if is_current:
+                self.current = None
+        if is_current and self.on_finish is not None:
+            self.on_finish(ctx)
+        ctx.finished.set()
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import hashlib
+import inspect
+import logging
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+default_config = {
+    "enabled": True,  # False时启动时导入并初始化全部模块
+    "manifest": "cache/plugins.json",
+    "init_timeout": 5,  # 启动时等待模块init的最长时间(秒)
+    "workers": 4,
+}
+
+
+class Text:
+    """在签名中原样显示的注解或默认值"""
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def describe(function):
+    """把函数的名称,签名和注释转换为可写入清单的字典"""
+    signature = inspect.signature(function)
+    params = []
+    for param in signature.parameters.values():
+        params.append({
+            "name": param.name,
+            "kind": param.kind.name,
+            "default": None if param.default is param.empty else repr(param.default),
+            "annotation": None if param.annotation is param.empty else inspect.formatannotation(param.annotation),
+        })
+    returns = signature.return_annotation
+    return {
+        "name": function.__name__,
+        "params": params,
+        "returns": None if returns is signature.empty else inspect.formatannotation(returns),
+        "doc": function.__doc__,
+    }
+
+
+class PluginLoader:
+    """根据清单缓存注册模块函数,模块在第一次被调用时才导入和初始化
+
+    清单以文件哈希为键记录每个模块的函数签名、注释和附加文本,文件未变化时无需导入即可生成提示词.
+    模块可以定义LAZY = False,表示附加文本依赖外部环境,启动后在后台重新初始化以刷新.
+    模块的init可能在工作线程中执行,不应在其中创建窗口.
+    代码执行进程中的模块函数默认是代理,经RPC回到主进程的GUI线程执行.模块可以定义PURE = True,
+    表示其函数无状态、不依赖init和GUI,执行进程直接导入模块调用(不执行init).
+    """
+
+    def __init__(self, config, directory):
+        self.config = {**default_config, **config.get("plugins", {})}
+        self.app_config = config
+        self.directory = directory
+        self.manifest = self.load_manifest()
+        self.loaded = {}  # 模块名 -> ({函数名: 函数}, 附加文本)
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def load_manifest(self):
+        path = self.config["manifest"]
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"插件清单加载失败:{e}")
+            return {}
+
+    def save_manifest(self):
+        path = self.config["manifest"]
+        with self.lock:
+            text = json.dumps(self.manifest, ensure_ascii=False, indent=1)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"插件清单保存失败:{e}")
+
+    def names(self):
+        return [file[:-3] for file in sorted(os.listdir(self.directory)) if file.endswith(".py")]
+
+    def lock_for(self, name):
+        with self.lock:
+            return self.locks.setdefault(name, threading.RLock())
+
+    def load(self, name, reload=False):
+        """导入并初始化模块,返回(函数列表, 附加文本),同一模块只初始化一次"""
+        with self.lock_for(name):
+            if name in self.loaded and not reload:
+                functions, extra = self.loaded[name]
+                return list(functions.values()), extra
+            full_name = f"modules.{name}"
+            digest = file_hash(os.path.join(self.directory, name + ".py"))
+            if full_name in sys.modules:
+                module = importlib.reload(sys.modules[full_name])
+            else:
+                module = importlib.import_module(full_name)
+            functions, extra = module.init(self.app_config)
+            self.loaded[name] = ({function.__name__: function for function in functions}, extra)
+            with self.lock:
+                self.manifest[name] = {
+                    "hash": digest,
+                    "lazy": getattr(module, "LAZY", True),
+                    "pure": getattr(module, "PURE", False),
+                    "functions": [describe(function) for function in functions],
+                    "extra": extra,
+                }
+            return functions, extra
+
+    def reload(self, name):
+        """模块文件变化后重新导入"""
+        functions, extra = self.load(name, reload=True)
+        self.save_manifest()
+        return functions, extra
+
+    def call(self, name, function_name, *args, **kwargs):
+        functions, _ = self.loaded[name] if name in self.loaded else ({}, None)
+        if function_name not in functions:
+            logging.info(f"首次调用,加载模块:{name}")
+            self.load(name)
+            functions, _ = self.loaded[name]
+        return functions[function_name](*args, **kwargs)
+
+    def stub(self, name, entry):
+        """按清单生成占位函数,签名和注释与原函数一致,调用时再加载模块"""
+        loader = self
+        function_name = entry["name"]
+
+        def stub(*args, **kwargs):
+            return loader.call(name, function_name, *args, **kwargs)
+
+        params = [
+            inspect.Parameter(
+                param["name"],
+                getattr(inspect.Parameter, param["kind"]),
+                default=inspect.Parameter.empty if param["default"] is None else Text(param["default"]),
+                annotation=inspect.Parameter.empty if param["annotation"] is None else Text(param["annotation"]),
+            )
+            for param in entry["params"]
+        ]
+        stub.__name__ = stub.__qualname__ = function_name
+        stub.__doc__ = entry["doc"]
+        stub.__module__ = f"modules.{name}"
+        returns = entry.get("returns")
+        stub.__signature__ = inspect.Signature(
+            params, return_annotation=inspect.Signature.empty if returns is None else Text(returns)
+        )
+        return stub
+
+    def load_all(self):
+        """返回{模块名: (函数列表, 附加文本)}
+
+        清单命中的模块返回占位函数,其余模块并行初始化,超时的模块本次启动不注册.
+        """
+        results = {}
+        pending = []
+        for name in self.names():
+            entry = self.manifest.get(name)
+            path = os.path.join(self.directory, name + ".py")
+            if self.config["enabled"] and entry and entry["hash"] == file_hash(path):
+                results[name] = ([self.stub(name, f) for f in entry["functions"]], entry["extra"])
+            else:
+                pending.append(name)
+
+        if pending:
+            executor = ThreadPoolExecutor(self.config["workers"], thread_name_prefix="plugin")
+            futures = {executor.submit(self.load, name): name for name in pending}
+            done, not_done = wait(futures, timeout=self.config["init_timeout"])
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    logging.error(f"模块初始化失败:{futures[future]}:{e}")
+            for future in not_done:
+                logging.error(f"模块初始化超时,本次不注册:{futures[future]}")
+                # 完成后仍写入清单,下次启动即可按需加载
+                future.add_done_callback(lambda _: self.save_manifest())
+            executor.shutdown(wait=False)
+            self.save_manifest()
+
+        logging.info(f"模块注册完成:按需加载{len(self.names()) - len(pending)}个,立即初始化{len(pending)}个")
+        return {name: results[name] for name in self.names() if name in results}
+
+    def specs(self):
+        """执行进程需要的模块列表[(模块名, [函数名], 是否在执行进程中直接调用)]"""
+        with self.lock:
+            return [
+                (name, [f["name"] for f in entry["functions"]], entry.get("pure", False))
+                for name, entry in self.manifest.items()
+                if name in self.names()
+            ]
+
+    def refresh(self, on_loaded):
+        """在后台初始化LAZY = False的模块,完成后以(模块名, 函数列表, 附加文本)回调"""
+        names = [
+            name for name, entry in self.manifest.items()
+            if not entry.get("lazy", True) and name not in self.loaded and name in self.names()
+        ]
+        if not names:
+            return
+
+        def run(name):
+            try:
+                old_extra = self.manifest[name]["extra"]
+                functions, extra = self.load(name)
+                if extra != old_extra:
+                    self.save_manifest()
+                    on_loaded(name, functions, extra)
+            except Exception as e:
+                logging.error(f"模块后台初始化失败:{name}:{e}")
+
+        executor = ThreadPoolExecutor(self.config["workers"], thread_name_prefix="plugin")
+        for name in names:
+            executor.submit(run, name)
+        executor.shutdown(wait=False)
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+default_config = {
+    "enabled": True,
+    "max_size": 256,
+    "ttl": 7 * 24 * 3600,
+    "path": "cache/responses.json",
+    "save_delay": 2.0,  # 最后一次修改后多久在后台写入磁盘
+}
+
+# 只缓存完全由这些代码块组成的回答(直接执行的命令),回答、提示和追问依赖具体情境
+cacheable_tags = ("python", "powershell")
+block_pattern = re.compile(r"```(\w*)\s.*?```", re.S)
+
+
+def normalize(text):
+    """归一化用户输入:全角转半角,去除空白和标点,统一小写"""
+    text = unicodedata.normalize("NFKC", text)
+    return "".join(
+        ch for ch in text.lower()
+        if not ch.isspace() and unicodedata.category(ch)[0] not in "PS"
+    )
+
+
+def is_cacheable(content):
+    tags = block_pattern.findall(content)
+    rest = block_pattern.sub("", content)
+    return bool(tags) and not rest.strip() and all(tag in cacheable_tags for tag in tags)
+
+
+def fingerprint(*parts):
+    """系统提示词(含函数列表)和模型的摘要,任一变化都会使缓存失效"""
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU+TTL的LLM响应缓存,条目为(写入时间, 回答, 模型)
+
+    修改后延迟在后台写入磁盘,请求线程不做文件操作;退出前应调用flush().
+    """
+
+    def __init__(self, config):
+        self.config = {**default_config, **config.get("cache", {})}
+        self.enabled = self.config["enabled"]
+        self.path = self.config["path"]
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.timer = None
+        self.lock = threading.Lock()
+        if self.enabled:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.fingerprint = data["fingerprint"]
+            self.entries = OrderedDict((k, tuple(v)) for k, v in data["entries"] if len(v) == 3)
+            logging.info(f"响应缓存已加载,共{len(self.entries)}条")
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"响应缓存加载失败:{e}")
+
+    def mark_dirty(self):
+        """调用时需持有self.lock"""
+        self.dirty = True
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(self.config["save_delay"], self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            self.dirty = False
+            text = json.dumps(
+                {"fingerprint": self.fingerprint, "entries": list(self.entries.items())}, ensure_ascii=False
+            )
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"响应缓存保存失败:{e}")
+
+    def validate(self, new_fingerprint):
+        """提示词,函数列表或模型变化时清空缓存"""
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.fingerprint == new_fingerprint:
+                return
+            if self.entries:
+                logging.info("提示词或模型已变化,清空响应缓存")
+            self.fingerprint = new_fingerprint
+            self.entries.clear()
+            self.mark_dirty()
+
+    def get(self, text):
+        """返回(回答, 模型),未命中时返回None"""
+        if not self.enabled:
+            return None
+        key = normalize(text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] > self.config["ttl"]:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                logging.info(f"响应缓存未命中:{key},命中{self.hits}/未命中{self.misses}")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            logging.info(f"响应缓存命中:{key},命中{self.hits}/未命中{self.misses}")
+            return entry[1], entry[2]
+
+    def put(self, text, content, model):
+        if not self.enabled or not is_cacheable(content):
+            return
+        key = normalize(text)
+        if not key:
+            return
+        with self.lock:
+            self.entries[key] = (time.time(), content, model)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.config["max_size"]:
+                self.entries.popitem(last=False)
+            self.mark_dirty()
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+from collections import deque
+
+default_config = {
+    "workers": 4,  # 同时执行的请求数上限
+    "voice": "main",  # 语音命令使用的会话
+    "cli": "main",  # 命令窗口使用的会话,与voice相同时两者共享对话历史
+}
+
+
+class Session:
+    """一段独立的对话历史,同一会话中的请求按提交顺序依次执行
+
+    系统提示词不保存在会话中,由LLMService在构造请求时加在历史之前.
+    """
+
+    def __init__(self, name, keep_dialog=5):
+        self.name = name
+        self.keep_dialog = keep_dialog
+        self.history = []  # 不含系统提示词的user/assistant消息
+        self.pending = deque()  # 等待执行的任务
+        self.running = False
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def begin(self, prompt):
+        """记录用户消息,返回(消息, 本次请求使用的历史快照)"""
+        message = {"role": "user", "content": prompt}
+        with self.lock:
+            self.history.append(message)
+            return message, list(self.history)
+
+    def commit(self, content):
+        """记录回答并裁剪历史"""
+        with self.lock:
+            self.history.append({"role": "assistant", "content": content})
+            if len(self.history) > self.keep_dialog * 2:
+                self.history = self.history[-self.keep_dialog * 2:]
+
+    def discard(self, message):
+        """请求被取消时撤回对应的用户消息"""
+        with self.lock:
+            self.history = [item for item in self.history if item is not message]
+
+    @property
+    def depth(self):
+        """排队中和执行中的请求数"""
+        return len(self.pending) + self.running
+
+
+class SessionManager:
+    """按名称管理会话,并在有限的工作线程中调度各会话的请求
+
+    不同会话的请求可以并发执行,同一会话的请求由一个排空循环依次执行,
+    排空循环占用一个工作线程,因此并发数不超过会话数和workers.
+    """
+
+    def __init__(self, config, executor):
+        self.config = {**default_config, **config.get("sessions", {})}
+        self.keep_dialog = config.get("keep_dialog", 5)
+        self.executor = executor
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            session = self.sessions.get(name)
+            if session is None:
+                session = self.sessions[name] = Session(name, self.keep_dialog)
+            return session
+
+    def for_source(self, source):
+        """语音或命令窗口对应的会话"""
+        return self.get(self.config.get(source) or source)
+
+    def submit(self, session, task):
+        """将task()加入会话队列,会话空闲时提交一个排空循环"""
+        with session.lock:
+            session.pending.append((task, time.perf_counter()))
+            ahead = session.depth - 1
+            if session.running:
+                start = False
+            else:
+                session.running = start = True
+        if ahead:
+            logging.info(f"会话{session.name}:前面还有{ahead}个请求")
+        if start:
+            self.executor.submit(self.drain, session)
+
+    def drain(self, session):
+        while True:
+            with session.lock:
+                if not session.pending:
+                    session.running = False
+                    return
+                task, queued = session.pending.popleft()
+            try:
+                task(time.perf_counter() - queued)
+            except Exception as e:
+                logging.error(f"会话{session.name}的请求执行失败:{e}")
+            with session.lock:
+                session.completed += 1
+
+    def stats(self):
+        """{会话名: (排队数, 是否执行中, 已完成数, 历史消息数)}"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        result = {}
+        for session in sessions:
+            with session.lock:
+                result[session.name] = (
+                    len(session.pending), session.running, session.completed, len(session.history)
+                )
+        return result
+
+    def table(self):
+        stats = self.stats()
+        if not stats:
+            return "暂无会话"
+        lines = [f"{'会话':<14}{'排队':>4}{'执行中':>6}{'已完成':>6}{'历史':>4}"]
+        for name, (pending, running, completed, history) in sorted(stats.items()):
+            lines.append(f"{name:<16}{pending:>6}{'是' if running else '否':>7}{completed:>9}{history:>6}")
+        return "\n".join(lines)
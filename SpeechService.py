@@ -1,105 +1,566 @@
-import time
-import numpy as np
-import sounddevice as sd
-# import speech_recognition as sr
-import aip.speech as aip
-import logging
-
-
-class SpeechService:
-    def __init__(self):
-        self.is_recording = False
-        self.audio_buffer = []
-        self.sample_rate = 16000
-        self.channels = 1
-        self.stime = 0
-
-    def start_recording(self):
-        self.is_recording = True
-        self.audio_buffer = []
-        self.stime = time.time()
-
-        def callback(indata, frames, time, status):
-            if self.is_recording:
-                self.audio_buffer.append(indata.copy())
-
-        with sd.InputStream(
-            callback=callback,
-            samplerate=self.sample_rate,
-            channels=self.channels,
-            dtype="int16",
-        ):
-            while self.is_recording:
-                sd.sleep(100)
-
-    def stop_recording(self):
-        """返回录音数据和录音时长"""
-        self.is_recording = False
-        if not self.audio_buffer:
-            return None
-        audio_data = np.concatenate(self.audio_buffer)
-        return audio_data, time.time() - self.stime
-
-    def speech_to_text(self, audio_data):
-        """将音频数据转换为文本"""
-        raise NotImplementedError("子类必须实现此方法")
-
-
-# class GoogleASR(SpeechService):
-#     def __init__(self):
-#         super().__init__()
-#         self.recognizer = sr.Recognizer()
-#         logging.info("使用GoogleASR初始化完成")
-
-#     def speech_to_text(self, audio_data):
-#         stime = time.time()
-#         audio_bytes = audio_data.tobytes()
-
-#         audio_data_sr = sr.AudioData(
-#             frame_data=audio_bytes,
-#             sample_rate=self.sample_rate,
-#             sample_width=2,  # int16类型对应2字节
-#         )
-#         text = self.recognizer.recognize_google(audio_data_sr, language="zh-CN")
-#         return text, time.time() - stime
-
-
-class BaiduASR(SpeechService):
-    def __init__(self, config):
-        super().__init__()
-        self.APP_ID = config["app_id"]
-        self.API_KEY = config["api_key"]
-        self.SECRET_KEY = config["secret_key"]
-        self.client = aip.AipSpeech(self.APP_ID, self.API_KEY, self.SECRET_KEY)
-        logging.info("语音服务初始化完成,服务商:BaiduASR")
-        logging.info(f"-APP_ID:{self.APP_ID}")
-        logging.info(f"-API_KEY:{self.API_KEY[:5] +  "*" * (len(self.API_KEY) - 8) + self.API_KEY[-3:]}")
-        logging.info(f"-SECRET_KEY:{self.SECRET_KEY[:5] + "*" * (len(self.SECRET_KEY) - 8) + self.SECRET_KEY[-3:]}")
-
-    def speech_to_text(self, audio_data):
-        stime = time.time()
-        audio_bytes = audio_data.tobytes()
-        result = self.client.asr(
-            audio_bytes,
-            "pcm",
-            self.sample_rate,
-            {
-                "dev_pid": 1537,  # 中文普通话识别
-            },
-        )
-        if "result" in result:
-            text = result["result"][0]
-        else:
-            text = ""
-            logging.error(f"BaiduASR返回错误:{result}")
-        return text, time.time() - stime
-
-
-def init(config):
-    # 将config中的值按照priority排序，返回优先级最高的ASR对象
-    config = sorted(config, key=lambda x: x["Priority"], reverse=True)[0]
-
-    # if config["name"] == "Google":
-    #     return GoogleASR()
-    if config["name"] == "Baidu":
-        return BaiduASR(config)
+import time
+import json
+import uuid
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+# import speech_recognition as sr
+import logging
+import Tracing
+from AudioBuffer import RingBuffer
+from AudioEncoder import AudioEncoder
+from VAD import VAD, Endpointer
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # 没有PortAudio的环境(如无声卡的Linux)仍可使用识别部分,录音不可用
+    sd = None
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+class StreamSession:
+    """流式识别会话:录音过程中不断送入音频,松开按键后取回最终结果"""
+
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial or (lambda text: logging.info(f"识别中:{text}"))
+
+    def feed(self, chunk):
+        """送入一段int16 PCM字节,必须是非阻塞的(在音频回调中调用)"""
+        raise NotImplementedError("子类必须实现此方法")
+
+    def finish(self, audio_data):
+        """结束送音频,返回识别结果和从结束到出结果的耗时.audio_data为完整录音"""
+        raise NotImplementedError("子类必须实现此方法")
+
+    def cancel(self):
+        """放弃本次识别"""
+        pass
+
+
+class BatchAdapter(StreamSession):
+    """将只支持整段识别的服务包装为流式接口"""
+
+    def __init__(self, service, on_partial=None):
+        super().__init__(on_partial)
+        self.service = service
+
+    def feed(self, chunk):
+        # 音频已在服务的环形缓冲区中,无需另存
+        pass
+
+    def finish(self, audio_data):
+        return self.service.speech_to_text(audio_data)
+
+
+class SpeechService:
+    # 服务商接受的上传格式和采样率
+    formats = ("pcm",)
+    sample_rates = (16000,)
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.name = config.get("name", type(self).__name__)
+        self.is_recording = False
+        # 设备只支持其他采样率或双声道时,上传前由编码阶段混合声道并重采样
+        self.sample_rate = config.get("sample_rate", 16000)
+        self.channels = config.get("channels", 1)
+        self.encoder = AudioEncoder(
+            config.get("encoding", {}), self.formats, self.sample_rates, self.sample_rate, self.name
+        )
+        self.last_upload = None  # 最近一次上传的格式、字节数和编码耗时
+        self.buffer = RingBuffer(config.get("max_seconds", 60), self.sample_rate, self.channels)
+        self.stime = 0
+        self.streaming = config.get("streaming", False)
+        self.stream_session = None
+        self.fed_pos = 0
+        self.press_time = None
+        self.vad = VAD(config.get("vad", {}), self.sample_rate)
+        # 免按键模式:由端点检测决定录音的开始和结束,需要常开麦克风
+        self.hands_free = config.get("hands_free", False)
+        # 常开麦克风模式:输入流始终打开,按键时向前保留一段预录音频
+        self.warm_mic = config.get("warm_mic", False) or self.hands_free
+        self.preroll = int(self.sample_rate * config.get("preroll_ms", 300) / 1000)
+        self.stream = None
+        self.closing = False
+        if self.warm_mic and sd is None:
+            # 缺少录音库时重试没有意义,只提示一次
+            logging.error("未安装sounddevice或找不到PortAudio,无法录音,常开麦克风和免按键模式已关闭")
+            self.warm_mic = self.hands_free = False
+        if self.warm_mic:
+            threading.Thread(target=self.open_stream, daemon=True).start()
+
+    def create_stream_session(self):
+        """创建流式识别会话,默认通过适配器使用整段识别"""
+        return BatchAdapter(self)
+
+    def open_stream(self):
+        """打开常开的输入流,失败时在后台重试"""
+        while not self.closing:
+            try:
+                self.stream = sd.InputStream(
+                    callback=self.callback,
+                    finished_callback=self.on_stream_finished,
+                    samplerate=self.sample_rate,
+                    channels=self.channels,
+                    dtype="int16",
+                )
+                self.stream.start()
+                logging.info("麦克风常开模式已启动")
+                return
+            except Exception as e:
+                logging.error(f"打开麦克风失败,1秒后重试:{e}")
+                time.sleep(1)
+
+    def on_stream_finished(self):
+        """输入流意外结束(如设备被拔出)时重新打开"""
+        if not self.closing:
+            logging.warning("麦克风输入流已中断,正在重新打开")
+            threading.Thread(target=self.open_stream, daemon=True).start()
+
+    def close(self):
+        self.closing = True
+        if self.stream is not None:
+            self.stream.close()
+
+    def callback(self, indata, frames, time_info, status):
+        if not (self.warm_mic or self.is_recording):
+            return
+        self.buffer.write(indata)
+        if not self.is_recording:
+            return
+        if self.press_time is not None:
+            latency = (time.perf_counter() - self.press_time) * 1000
+            self.press_time = None
+            logging.info(f"按键到首个采样耗时:{latency:.0f}ms")
+        if self.stream_session is not None:
+            self.stream_session.feed(self.buffer.view(self.fed_pos).tobytes())
+            self.fed_pos = self.buffer.write_pos
+
+    def start_recording(self, preroll=None):
+        if sd is None:
+            logging.error("未安装sounddevice或找不到PortAudio,无法录音")
+            return
+        self.press_time = time.perf_counter()
+        self.stime = self.press_time
+        self.stream_session = None
+        if self.streaming:
+            try:
+                self.stream_session = self.create_stream_session()
+            except Exception as e:
+                logging.error(f"创建流式识别会话失败,将使用整段识别:{e}")
+
+        if preroll is None:
+            preroll = self.preroll if self.warm_mic else 0
+        self.buffer.reset(preroll)
+        self.fed_pos = self.buffer.start_pos
+        self.is_recording = True
+        if self.warm_mic:
+            # 输入流已打开,只需标记录音起点
+            return
+
+        with sd.InputStream(
+            callback=self.callback,
+            samplerate=self.sample_rate,
+            channels=self.channels,
+            dtype="int16",
+        ):
+            while self.is_recording:
+                sd.sleep(100)
+
+    def stop_recording(self):
+        """返回录音数据和录音时长,没有检测到语音时录音数据为None"""
+        self.is_recording = False
+        time_last = time.perf_counter() - self.stime
+        if self.buffer.overflowed:
+            logging.warning("录音超过最大时长,开头部分已被丢弃")
+        # 返回缓冲区的视图,不复制数据
+        audio_data = self.buffer.view()
+        if len(audio_data):
+            audio_data = self.vad.trim(audio_data)
+        else:
+            audio_data = None
+        if audio_data is None and self.stream_session is not None:
+            self.stream_session.cancel()
+            self.stream_session = None
+        return audio_data, time_last
+
+    def start_hands_free(self, on_start, on_end):
+        """启动免按键模式,检测到说话开始和结束时分别回调on_start和on_end"""
+        threading.Thread(
+            target=self.hands_free_loop, args=(on_start, on_end), daemon=True
+        ).start()
+        logging.info("免按键模式已启动")
+
+    def hands_free_loop(self, on_start, on_end):
+        endpointer = Endpointer(self.vad)
+        base = pos = self.buffer.write_pos
+        frame_len = self.vad.frame_len
+        while not self.closing:
+            time.sleep(0.05)
+            n = (self.buffer.write_pos - pos) // frame_len * frame_len
+            if n <= 0:
+                continue
+            audio = self.buffer.view(pos)[:n, 0]
+            for event, offset in endpointer.process(audio):
+                if event == "start" and not self.is_recording:
+                    self.start_recording(preroll=self.buffer.write_pos - (base + offset))
+                    on_start()
+                elif event == "end" and self.is_recording:
+                    on_end()
+            pos += n
+
+    def encode(self, audio_data):
+        """预处理并编码为服务商接受的格式,返回(上传数据, 格式, 采样率)"""
+        data, format_, rate, self.last_upload = self.encoder.encode(audio_data)
+        return data, format_, rate
+
+    def speech_to_text(self, audio_data):
+        """将音频数据转换为文本"""
+        raise NotImplementedError("子类必须实现此方法")
+
+    def recognize(self, audio_data):
+        """取回识别结果,流式会话失败时退回整段识别"""
+        session, self.stream_session = self.stream_session, None
+        if session is not None:
+            try:
+                result = session.finish(audio_data)
+                Tracing.annotate(streaming=True)
+                return result
+            except Exception as e:
+                logging.error(f"流式识别失败,将使用整段识别:{e}")
+        return self.speech_to_text(audio_data)
+
+
+class RealtimeSession(StreamSession):
+    """百度实时语音识别(WebSocket)会话,MockServer中的本地替身服务使用相同协议"""
+
+    frame_bytes = 5120  # 160ms的16kHz int16音频
+
+    def __init__(self, url, start_data, on_partial=None, timeout=5):
+        super().__init__(on_partial)
+        if websocket is None:
+            raise RuntimeError("未安装websocket-client")
+        self.url = url
+        self.start_data = start_data
+        self.timeout = timeout
+        self.ws = None
+        self.results = []
+        self.error = None
+        self.queue = queue.Queue()
+        self.receiver = None
+        # 建立连接放在发送线程中,连接期间的音频先在队列中排队,不推迟录音
+        self.sender = threading.Thread(target=self._send_loop, daemon=True)
+        self.sender.start()
+
+    def feed(self, chunk):
+        self.queue.put(chunk)
+
+    def _send_loop(self):
+        try:
+            self.ws = websocket.create_connection(
+                f"{self.url}?sn={uuid.uuid4()}", timeout=self.timeout
+            )
+            self.ws.send(json.dumps({"type": "START", "data": self.start_data}))
+        except Exception as e:
+            self.error = e
+            return
+        self.receiver = threading.Thread(target=self._recv_loop, daemon=True)
+        self.receiver.start()
+
+        pending = b""
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            pending += chunk
+            while len(pending) >= self.frame_bytes:
+                self.ws.send_binary(pending[: self.frame_bytes])
+                pending = pending[self.frame_bytes :]
+        if pending:
+            self.ws.send_binary(pending)
+        self.ws.send(json.dumps({"type": "FINISH"}))
+
+    def _recv_loop(self):
+        try:
+            while True:
+                message = self.ws.recv()
+                if not message:
+                    break
+                result = json.loads(message)
+                if result.get("err_no", 0) != 0:
+                    self.error = result
+                    continue
+                if result.get("type") == "MID_TEXT":
+                    self.on_partial("".join(self.results) + result["result"])
+                elif result.get("type") == "FIN_TEXT":
+                    self.results.append(result["result"])
+        except (websocket.WebSocketException, OSError):
+            pass
+
+    def cancel(self):
+        self.queue.put(None)
+
+    def finish(self, audio_data):
+        stime = time.time()
+        self.queue.put(None)
+        self.sender.join(self.timeout)
+        if self.receiver is not None:
+            self.receiver.join(self.timeout)
+        if self.ws is not None:
+            self.ws.close()
+        if self.error and not self.results:
+            raise RuntimeError(f"实时识别失败:{self.error}")
+        return "".join(self.results), time.time() - stime
+
+
+class BaiduASR(SpeechService):
+    formats = ("pcm", "wav", "amr", "m4a")
+    sample_rates = (16000,)
+    no_speech_errors = (3301,)  # 音频质量过差(通常是没有说话),视为空结果而不是服务故障
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.APP_ID = config["app_id"]
+        self.API_KEY = config["api_key"]
+        self.SECRET_KEY = config["secret_key"]
+        from aip.speech import AipSpeech  # 只在使用百度识别时导入
+
+        self.client = AipSpeech(self.APP_ID, self.API_KEY, self.SECRET_KEY)
+        self.realtime_url = config.get("realtime_url", "wss://vop.baidu.com/realtime_asr")
+        logging.info("语音服务初始化完成,服务商:BaiduASR")
+        logging.info(f"-APP_ID:{self.APP_ID}")
+        logging.info(f"-API_KEY:{self.API_KEY[:5] +  "*" * (len(self.API_KEY) - 8) + self.API_KEY[-3:]}")
+        logging.info(f"-SECRET_KEY:{self.SECRET_KEY[:5] + "*" * (len(self.SECRET_KEY) - 8) + self.SECRET_KEY[-3:]}")
+        if self.streaming and (self.sample_rate != 16000 or self.channels != 1):
+            logging.warning("实时识别需要16kHz单声道录音,已改为整段识别")
+            self.streaming = False
+        logging.info(f"-流式识别:{self.realtime_url if self.streaming else '关闭'}")
+        logging.info(f"-上传格式:{self.encoder.format},{self.encoder.out_rate}Hz")
+
+    def create_stream_session(self):
+        return RealtimeSession(
+            self.realtime_url,
+            {
+                "appid": int(self.APP_ID),
+                "appkey": self.API_KEY,
+                "dev_pid": 15372,  # 中文普通话(加强标点)
+                "cuid": "spassit",
+                "format": "pcm",
+                "sample": self.sample_rate,
+            },
+        )
+
+    def speech_to_text(self, audio_data):
+        stime = time.time()
+        audio_bytes, format_, rate = self.encode(audio_data)
+        result = self.client.asr(
+            audio_bytes,
+            format_,
+            rate,
+            {
+                "dev_pid": 1537,  # 中文普通话识别
+            },
+        )
+        if "result" in result:
+            text = result["result"][0]
+        elif result.get("err_no") in self.no_speech_errors:
+            text = ""
+            logging.info(f"BaiduASR未识别到语音:{result.get('err_msg')}")
+        else:
+            # 接口错误计入服务商的失败次数,由服务池转移到其他服务
+            raise RuntimeError(f"BaiduASR返回错误:{result}")
+        return text, time.time() - stime
+
+
+class MockASR(SpeechService):
+    """测试用的语音服务,可注入延迟和错误"""
+
+    formats = ("pcm", "wav", "flac", "m4a")
+    sample_rates = (16000, 8000)
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.text = config.get("text", "打开连点")
+        self.delay = config.get("delay", 0.2)
+        self.error_rate = config.get("error_rate", 0)
+        logging.info(f"语音服务初始化完成,服务商:MockASR({self.name}),延迟:{self.delay}s")
+
+    def speech_to_text(self, audio_data):
+        stime = time.time()
+        self.encode(audio_data)
+        time.sleep(self.delay)
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"{self.name}注入的错误")
+        return self.text, time.time() - stime
+
+
+class ProviderStats:
+    """单个服务商的滚动延迟和错误统计"""
+
+    def __init__(self, window=50):
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.failures = 0  # 连续失败次数
+        self.cooldown_until = 0
+
+    def record(self, latency, ok):
+        self.errors.append(not ok)
+        if ok:
+            self.latencies.append(latency)
+            self.failures = 0
+        else:
+            self.failures += 1
+
+    def percentile(self, q, default):
+        if not self.latencies:
+            return default
+        return float(np.percentile(self.latencies, q))
+
+    @property
+    def error_rate(self):
+        return sum(self.errors) / len(self.errors) if self.errors else 0
+
+
+class ProviderPool(SpeechService):
+    """持有所有已配置的语音服务,对识别请求进行对冲和故障转移
+
+    首选服务在其p90延迟内未返回时,把同一段音频发给下一个服务,先成功者胜出.
+    连续失败的服务进入冷却期,期间不参与选择.
+    """
+
+    default_config = {
+        "hedge": True,
+        "hedge_delay": 1.5,  # 样本不足时使用的对冲等待时间
+        "min_samples": 5,
+        "max_failures": 3,
+        "cooldown": 30,
+    }
+
+    def __init__(self, providers, config, capture_config):
+        super().__init__(capture_config)
+        self.config = {**self.default_config, **config}
+        self.providers = providers  # 已按优先级排序
+        self.stats = {provider.name: ProviderStats() for provider in providers}
+        self.executor = ThreadPoolExecutor(max_workers=max(len(providers) * 2, 2))
+        self.lock = threading.Lock()
+        self.streaming = any(provider.streaming for provider in providers)
+        logging.info(f"语音服务池:{', '.join(p.name for p in providers)}")
+
+    def ranked(self):
+        """冷却中的服务除外,按中位延迟排序(样本不足时按优先级)"""
+        now = time.time()
+        available = [p for p in self.providers if self.stats[p.name].cooldown_until <= now]
+        if not available:
+            # 全部在冷却中时仍然尝试,避免完全无法识别
+            available = list(self.providers)
+
+        def key(item):
+            index, provider = item
+            stats = self.stats[provider.name]
+            if len(stats.latencies) < self.config["min_samples"]:
+                return (self.config["hedge_delay"], index)
+            return (stats.percentile(50, 0), index)
+
+        return [p for _, p in sorted(enumerate(available), key=key)]
+
+    def hedge_delay(self, provider):
+        stats = self.stats[provider.name]
+        if len(stats.latencies) < self.config["min_samples"]:
+            return self.config["hedge_delay"]
+        return stats.percentile(90, self.config["hedge_delay"])
+
+    def create_stream_session(self):
+        for provider in self.ranked():
+            if provider.streaming:
+                return provider.create_stream_session()
+        return BatchAdapter(self)
+
+    def call(self, provider, audio_data):
+        """只有异常(含接口返回的错误)计为失败,识别结果为空(如录音中没有说话)仍是成功"""
+        stime = time.perf_counter()
+        try:
+            text, _ = provider.speech_to_text(audio_data)
+            ok = True
+        except Exception as e:
+            logging.error(f"{provider.name}识别失败:{e}")
+            text, ok = "", False
+        self.record(provider, time.perf_counter() - stime, ok)
+        Tracing.observe("asr", provider.name, time.perf_counter() - stime)
+        return provider, text, ok
+
+    def record(self, provider, latency, ok):
+        with self.lock:
+            stats = self.stats[provider.name]
+            stats.record(latency, ok)
+            if stats.failures >= self.config["max_failures"]:
+                stats.cooldown_until = time.time() + self.config["cooldown"]
+                stats.failures = 0
+                logging.warning(f"{provider.name}连续失败,冷却{self.config['cooldown']}s")
+
+    def speech_to_text(self, audio_data):
+        stime = time.time()
+        candidates = self.ranked()
+        pending = set()
+        while candidates or pending:
+            if candidates and (not pending or self.config["hedge"]):
+                provider = candidates.pop(0)
+                pending.add(self.executor.submit(self.call, provider, audio_data))
+                timeout = self.hedge_delay(provider) if candidates else None
+            else:
+                timeout = None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider, text, ok = future.result()
+                if ok:
+                    Tracing.annotate(provider=provider.name, hedged=bool(pending), **(provider.last_upload or {}))
+                    self.log_stats(provider, bool(pending))
+                    return text, time.time() - stime
+            # 超时未返回则对冲,出错则立即转移到下一个服务
+        return "", time.time() - stime
+
+    def log_stats(self, winner, hedged):
+        summary = ", ".join(
+            f"{name}:p50={stats.percentile(50, 0):.2f}s/p90={stats.percentile(90, 0):.2f}s"
+            f"/错误率{stats.error_rate:.0%}"
+            for name, stats in self.stats.items()
+        )
+        logging.info(f"识别由{winner.name}完成{'(对冲)' if hedged else ''};{summary}")
+
+
+def create(config, capture=None):
+    """根据配置创建单个语音服务,成员服务只负责识别,不录音.capture为实际录音的配置"""
+    capture = capture or config
+    config = {
+        **config, "max_seconds": 0, "warm_mic": False, "hands_free": False,
+        "sample_rate": capture.get("sample_rate", 16000), "channels": capture.get("channels", 1),
+    }
+    # if config["name"] == "Google":
+    #     return GoogleASR()
+    if config["name"] == "Baidu":
+        return BaiduASR(config)
+    if config["name"].startswith("Mock"):
+        return MockASR(config)
+    logging.info(f"不支持的语音服务:{config['name']},已忽略")
+
+
+def init(config, pool_config=None):
+    # 将config中的值按照priority排序，录音参数取优先级最高的配置
+    config = sorted(config, key=lambda x: x["Priority"], reverse=True)
+    providers = []
+    for item in config:
+        try:
+            provider = create(item, config[0])
+        except Exception as e:
+            logging.error(f"语音服务{item['name']}初始化失败:{e}")
+            continue
+        if provider is not None:
+            providers.append(provider)
+    return ProviderPool(providers, pool_config or {}, config[0])
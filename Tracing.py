@@ -0,0 +1,141 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+default_config = {
+    "enabled": True,
+    "path": "logs/traces.jsonl",  # 每个请求的span树追加写入该文件
+    "window": 1000,  # 每个直方图保留的最近样本数
+}
+
+config = dict(default_config)
+histograms = {}  # (阶段, 服务商/模型) -> Histogram
+lock = threading.Lock()
+local = threading.local()
+
+
+class Histogram:
+    """保留最近window个样本的滚动分位数统计"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentiles(self, *ps):
+        data = sorted(self.samples)
+        return [data[min(int(len(data) * p / 100), len(data) - 1)] for p in ps]
+
+
+def observe(stage, key, seconds):
+    """记录一个耗时样本,key为服务商、模型等,可为None"""
+    if not config["enabled"]:
+        return
+    with lock:
+        histogram = histograms.get((stage, key))
+        if histogram is None:
+            histogram = histograms[(stage, key)] = Histogram(config["window"])
+        histogram.add(seconds)
+
+
+class Span:
+    """一段计时,结束时计入同名直方图"""
+
+    def __init__(self, name, parent=None, start=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.attrs = attrs
+        self.children = []
+        if parent is not None:
+            with lock:
+                parent.children.append(self)
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def child(self, name, start=None, **attrs):
+        return Span(name, self, start, **attrs)
+
+    def finish(self, end=None, **attrs):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter() if end is None else end
+        self.attrs.update(attrs)
+        observe(self.name, None, self.end - self.start)
+
+    def __enter__(self):
+        self.previous = getattr(local, "span", None)
+        local.span = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        local.span = self.previous
+        self.finish(status="ok" if exc_type is None else exc_type.__name__)
+
+    def to_dict(self, origin):
+        with lock:
+            children = list(self.children)
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [c.to_dict(origin) for c in children]} if children else {}),
+        }
+
+
+def current():
+    return getattr(local, "span", None)
+
+
+def span(name, parent=None, **attrs):
+    """在当前线程的span下创建子span,用with包裹被计时的代码"""
+    return Span(name, parent or current(), **attrs)
+
+
+def annotate(**attrs):
+    """给当前线程的span附加属性,如服务商和模型"""
+    current_span = current()
+    if current_span is not None:
+        current_span.attrs.update(attrs)
+
+
+def export(root, **fields):
+    """请求结束后把span树追加到JSONL文件"""
+    if not config["enabled"] or not config["path"]:
+        return
+    record = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), **fields, **root.to_dict(root.start)}
+    try:
+        with open(config["path"], "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"追踪记录写入失败:{e}")
+
+
+def table():
+    """当前各阶段的分位数表"""
+    with lock:
+        rows = [
+            (stage, key, histogram.count, *histogram.percentiles(50, 90, 99))
+            for (stage, key), histogram in histograms.items()
+        ]
+    if not rows:
+        return "暂无统计数据"
+    rows.sort(key=lambda row: (row[0], row[1] or ""))
+    lines = [f"{'阶段':<24}{'次数':>4}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}"]
+    for stage, key, count, p50, p90, p99 in rows:
+        name = f"{stage}[{key}]" if key else stage
+        lines.append(f"{name:<26}{count:>6}{p50 * 1000:>10.0f}{p90 * 1000:>10.0f}{p99 * 1000:>10.0f}")
+    return "\n".join(lines)
+
+
+def init(app_config):
+    config.update({**default_config, **app_config.get("tracing", {})})
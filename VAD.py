@@ -0,0 +1,111 @@
+"""基于帧能量和过零率的语音活动检测"""
+import logging
+import numpy as np
+
+default_config = {
+    "enabled": True,
+    "frame_ms": 20,
+    "min_db": -50,  # 低于该能量的帧一律视为静音
+    "margin_db": 10,  # 高于噪声底的余量
+    "peak_range_db": 20,  # 与峰值相差该范围内的帧一律视为语音
+    "zcr_threshold": 0.25,  # 清辅音(如s,sh,x)能量低但过零率高
+    "min_speech_ms": 100,
+    "pad_ms": 150,
+    "end_silence_ms": 700,  # 免按键模式下,静音超过该时长视为说完
+}
+
+
+class VAD:
+    def __init__(self, config, sample_rate=16000):
+        self.config = {**default_config, **config}
+        self.enabled = self.config["enabled"]
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * self.config["frame_ms"] // 1000
+        self.min_frames = max(self.config["min_speech_ms"] // self.config["frame_ms"], 1)
+        self.pad_frames = self.config["pad_ms"] // self.config["frame_ms"]
+        self.trimmed_bytes = 0
+        self.skipped_calls = 0
+
+    def features(self, audio):
+        """一次遍历计算每帧的能量(dBFS)和过零率,不足一帧的尾部忽略.多声道时按第一个声道判断"""
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        n = len(audio) // self.frame_len
+        frames = audio[: n * self.frame_len].reshape(n, self.frame_len).astype(np.float32)
+        energy = 10 * np.log10(np.mean(frames * frames, axis=1) / 32768.0**2 + 1e-10)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return energy, zcr
+
+    def is_speech(self, energy, zcr, threshold):
+        return (energy > threshold) | (
+            (energy > threshold - 6) & (zcr > self.config["zcr_threshold"])
+        )
+
+    def speech_mask(self, audio):
+        energy, zcr = self.features(audio)
+        if not len(energy):
+            return energy > 0
+        floor = np.percentile(energy, 10)
+        threshold = max(
+            self.config["min_db"],
+            min(floor + self.config["margin_db"], energy.max() - self.config["peak_range_db"]),
+        )
+        return self.is_speech(energy, zcr, threshold)
+
+    def trim(self, audio):
+        """裁掉首尾静音,返回原缓冲区的视图;没有语音时返回None"""
+        if not self.enabled:
+            return audio
+        mask = self.speech_mask(audio)
+        frames = np.flatnonzero(mask)
+        if len(frames) < self.min_frames:
+            self.skipped_calls += 1
+            logging.info(f"未检测到语音,跳过识别,累计跳过{self.skipped_calls}次")
+            return None
+        start = max(frames[0] - self.pad_frames, 0) * self.frame_len
+        end = min((frames[-1] + 1 + self.pad_frames) * self.frame_len, len(audio))
+        trimmed = (len(audio) - (end - start)) * audio.itemsize
+        self.trimmed_bytes += trimmed
+        logging.info(
+            f"裁剪静音{trimmed}字节({trimmed / audio.itemsize / self.sample_rate:.2f}s),"
+            f"累计裁剪{self.trimmed_bytes}字节,跳过识别{self.skipped_calls}次"
+        )
+        return audio[start:end]
+
+
+class Endpointer:
+    """免按键模式的端点检测:逐帧判断说话开始和结束"""
+
+    def __init__(self, vad):
+        self.vad = vad
+        self.end_frames = vad.config["end_silence_ms"] // vad.config["frame_ms"]
+        self.noise_floor = vad.config["min_db"]
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.processed = 0  # 已处理的样本数
+
+    def process(self, audio):
+        """处理新到的音频(长度应为整帧),返回事件列表[("start"|"end", 样本序号)]"""
+        events = []
+        energy, zcr = self.vad.features(audio)
+        threshold = max(self.vad.config["min_db"], self.noise_floor + self.vad.config["margin_db"])
+        for i, speech in enumerate(self.vad.is_speech(energy, zcr, threshold)):
+            if not speech and not self.in_speech:
+                # 只用静音帧跟踪噪声底
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy[i]
+            if self.in_speech:
+                self.silence_run = 0 if speech else self.silence_run + 1
+                if self.silence_run >= self.end_frames:
+                    self.in_speech = False
+                    self.speech_run = 0
+                    events.append(("end", self.processed + i * self.vad.frame_len))
+            else:
+                self.speech_run = self.speech_run + 1 if speech else 0
+                if self.speech_run >= self.vad.min_frames:
+                    self.in_speech = True
+                    self.silence_run = 0
+                    start = i - self.speech_run + 1 - self.vad.pad_frames
+                    events.append(("start", self.processed + start * self.vad.frame_len))
+        self.processed += len(energy) * self.vad.frame_len
+        return events
@@ -1,180 +1,403 @@
-import os
-import sys
-import Gui
-import json
-import time
-import logging
-import inspect
-import Globals
-import keyboard
-import importlib
-import threading
-import LLMService
-import SpeechService
-from datetime import datetime
-from PyQt5.QtWidgets import QMessageBox
-
-def init_logger():
-    log_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    Globals.log_path = f"logs/{log_time}.log"
-    if not os.path.exists("logs"):
-        os.makedirs("logs")
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler(Globals.log_path, encoding="utf-8"),
-            logging.StreamHandler(),
-        ],
-    )
-
-def log_inlines(message, level=logging.INFO):
-    for line in str(message).splitlines():
-        logging.log(level, line)
-
-def text_handler():
-    if Globals.text is not None:
-        Globals.reponse, time_cost = LLMService.call_llm_api(Globals.text)
-        log_inlines(f"响应结果：\n{Globals.reponse}\n耗时:{time_cost:.2f}s")
-        Gui.run_in_main_thread(Globals.controller.close_window)
-        Gui.run_in_main_thread(Globals.reponse_handler)
-Globals.text_handler = text_handler
-
-def response_handler():
-    Globals.modified = True
-
-    pycode, pscode, note = "", "", ""
-
-    if "```python" in Globals.reponse:
-        pycode = Globals.reponse.split("```python")[1].split("```")[0].strip()
-
-    if "```powershell" in Globals.reponse:
-        pscode = Globals.reponse.split("```powershell")[1].split("```")[0].strip()
-
-    if "```note" in Globals.reponse:
-        note = Globals.reponse.split("```note")[1].split("```")[0].strip()
-
-    if pycode or pscode or note:
-        if note or Globals.always_ask:
-            if Gui.info(f"提示：{note}\n将运行的代码:\n{pscode+pycode}") != QMessageBox.Ok:
-                logging.info("取消操作")
-                Globals.reponse = None
-                return
-
-        if pycode != "":
-            try:
-                exec(pycode)
-            except Exception as e:
-                logging.info(f"执行python失败:{e}", level=logging.ERROR)
-
-        if pscode != "":
-            try:
-                os.system("powershell -Command " + pscode)
-            except Exception as e:
-                logging.info(f"执行powershell失败:{e}")
-
-    if "```answer" in Globals.reponse:
-        answer = Globals.reponse.split("```answer")[1].split("```")[0].strip()
-        logging.info(f"answer:{answer}")
-        Gui.info(answer, buttons=QMessageBox.Ok)
-
-    if "```ambiguous```" in Globals.reponse:
-        logging.info(f"ambiguous input")
-        Gui.info(f"输入不明确：{Globals.text}", buttons=QMessageBox.Yes)
-Globals.reponse_handler = response_handler
-
-
-def hotkey_pressed_handler():
-    if not Globals.is_recording:
-        threading.Thread(target=Globals.speech_service.start_recording).start()
-        logging.info("录音开始...")
-        Gui.run_in_main_thread(Globals.controller.create_window)
-        Globals.is_recording = True
-
-
-def hotkey_released_handler(event):
-    """按键松开时，开始识别"""
-    if Globals.is_recording and event.name == Globals.hotkey:
-        Globals.is_recording = False
-        try:
-            audio_data, time_last = Globals.speech_service.stop_recording()
-            logging.info(f"录音结束，时长:{time_last:.2f}s")
-            Gui.run_in_main_thread(Globals.controller.update_state)
-            Globals.text, time_cost = Globals.speech_service.speech_to_text(audio_data)
-            logging.info(f"识别结果：{Globals.text},耗时:{time_cost:.2f}s")
-            Gui.run_in_main_thread(Globals.controller.update_state)
-            text_handler()
-        except Exception as e:
-            logging.error(f"处理音频失败: {str(e)}")
-            Gui.run_in_main_thread(Globals.controller.close_window)
-
-    keyboard.release(Globals.hotkey)
-
-
-def save_config(config):
-    """保存配置"""
-    while True:
-        if not Globals.modified:
-            time.sleep(30)
-            continue
-        with open("config.json", "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
-        logging.info("配置已保存")
-        Globals.modified = False
-
-
-def register_function(config):
-    """注册所有模块中的函数"""
-    prompts = ""  # 生成提示语
-    
-    #判断是否在打包环境中
-    if getattr(sys, 'frozen', False):
-        dir="_internal/modules"
-    else:
-        dir="modules"
-
-    for file in os.listdir(dir):
-        if file.endswith(".py"):
-            module_name = file[:-3]
-            module = importlib.import_module(f"modules.{module_name}")
-            logging.info(f"加载模块:{module_name}")
-            functions,extra = module.init(config)
-            for function in functions:
-                sig = inspect.signature(function)
-                logging.info(f"-注册函数:{module_name}.{function.__name__}{sig}")
-                globals()[function.__name__] = function
-                prompts += f"def {function.__name__}{sig}\n作用:{function.__doc__}\n"
-            prompts += extra if extra else ""
-            extra = None
-    return prompts
-
-
-def main():
-    # 加载配置
-    Globals.config = json.load(open("config.json", encoding="utf-8"))
-    Globals.always_ask = Globals.config["always_ask"]
-    Globals.hotkey = Globals.config["hotkey"]
-    Globals.icon = Globals.config["icon"]
-
-    # 初始化日志
-    init_logger()
-
-    # 启动配置保存线程
-    threading.Thread(target=save_config, args=(Globals.config,), daemon=True).start()
-
-    # 注册模块函数并初始化LLM服务
-    funcs = register_function(Globals.config)
-    LLMService.init(Globals.config, funcs)
-
-    # 初始化语音服务
-    Globals.speech_service = SpeechService.init(Globals.config["speech_services"])
-
-    # 注册快捷键
-    keyboard.add_hotkey(Globals.hotkey, hotkey_pressed_handler)
-    keyboard.on_release(hotkey_released_handler)
-
-    # 启动事件循环
-    sys.exit(Gui.run_QtApp())
-
-if __name__ == "__main__":
-    main()
+import time
+
+start_time = phase_time = time.perf_counter()
+startup_phases = []  # (阶段, 耗时)
+
+import os
+import sys
+import Gui
+import json
+import logging
+import inspect
+import Globals
+import keyboard
+import threading
+import LLMService
+import Pipeline
+import IntentRouter
+import FunctionCatalog
+import FileWatcher
+import ConfigStore
+import PluginLoader
+import Executor
+import LogPipeline
+import Tracing
+import multiprocessing
+from datetime import datetime
+from PyQt5.QtWidgets import QMessageBox
+
+def init_logger():
+    log_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    Globals.log_path = f"logs/{log_time}.log"
+    if not os.path.exists("logs"):
+        os.makedirs("logs")
+    LogPipeline.setup(Globals.log_path)
+
+def log_inlines(message, level=logging.INFO):
+    for line in str(message).splitlines():
+        logging.log(level, line)
+
+def text_handler(text):
+    """文本命令入口,在命令窗口的会话中排队处理并立即返回"""
+    if text:
+        ctx = Pipeline.RequestContext("cli", text)
+        Globals.pipeline.submit(ctx, [("llm", llm_stage), ("execute", execute_stage)])
+Globals.text_handler = text_handler
+
+def capture_stage(ctx):
+    """录音已在松开按键时停止,这里只检查结果"""
+    if ctx.audio is None:
+        ctx.cancel("未检测到语音")
+        return
+    Gui.run_in_main_thread(lambda: Globals.controller.set_state(1), key="status")
+
+def asr_stage(ctx):
+    ctx.text, time_cost = Globals.speech_service.recognize(ctx.audio)
+    logging.info(f"识别结果：{ctx.text},耗时:{time_cost:.2f}s")
+    if not ctx.text:
+        ctx.cancel("识别结果为空")
+        return
+    Globals.text = ctx.text
+    Gui.run_in_main_thread(lambda: Globals.controller.set_state(2), key="status")
+
+def llm_stage(ctx):
+    code = Globals.router.match(ctx.text)
+    if code is not None:
+        ctx.response = f"```python\n{code}\n```"
+    elif Globals.config["payload"].get("stream"):
+        stream_llm(ctx)
+    else:
+        ctx.response, time_cost = LLMService.call_llm_api(ctx.text, ctx)
+        log_inlines(f"响应结果：\n{ctx.response}\n耗时:{time_cost:.2f}s")
+    Globals.reponse = ctx.response
+
+def execute_stage(ctx):
+    Gui.run_in_main_thread(Globals.controller.close_window)
+    if ctx.deferred is None:
+        Gui.run_in_main_thread(lambda: response_handler(ctx)).result()
+    elif ctx.deferred:
+        Gui.run_in_main_thread(lambda: confirm_and_run(ctx.deferred, ctx)).result()
+    # 等待代码执行结束,请求被取消时中止仍在运行的任务
+    execute_span = Tracing.current()
+    for job in list(ctx.jobs):
+        job.wait()
+        if execute_span is not None and job.started is not None:
+            execute_span.child("job", job.started, tag=job.tag).finish(job.finished, status=job.status)
+
+def pipeline_finished(ctx):
+    Gui.run_in_main_thread(Globals.controller.close_window)
+
+def stream_llm(ctx):
+    """流式处理响应,代码块闭合后立即派发到主线程执行"""
+    ctx.deferred = []  # 出现note或需要确认时,代码块留到执行阶段统一确认
+
+    def on_block(tag, body):
+        if ctx.cancelled:
+            return
+        if tag == "note" or (tag in ("python", "powershell") and (ctx.deferred or Globals.always_ask)):
+            ctx.deferred.append((tag, body))
+        elif tag in ("python", "powershell"):
+            run_code(tag, body, ctx)
+        elif tag == "answer":
+            Gui.run_in_main_thread(lambda: show_answer(body))
+        elif tag == "ambiguous":
+            Gui.run_in_main_thread(lambda: show_ambiguous(ctx.text))
+
+    ctx.response, time_cost = LLMService.call_llm_api_stream(ctx.text, on_block, ctx)
+    log_inlines(f"响应结果：\n{ctx.response}\n耗时:{time_cost:.2f}s")
+
+def run_code(tag, code, ctx=None):
+    """在执行进程中运行python或powershell代码,同一请求的代码按顺序执行"""
+    after = ctx.jobs[-1] if ctx is not None and ctx.jobs else None
+    job = Globals.executor.submit(tag, code, after)
+    if ctx is not None:
+        ctx.jobs.append(job)
+        ctx.on_cancel(job.cancel)
+    return job
+
+def call_in_main(name, args, kwargs):
+    """执行进程通过RPC调用的模块函数,在GUI线程中执行"""
+    return Gui.run_in_main_thread(lambda: globals()[name](*args, **kwargs)).result()
+
+def confirm_and_run(blocks, ctx=None):
+    """弹窗确认后执行被推迟的代码块"""
+    note = "".join(body for tag, body in blocks if tag == "note")
+    codes = [(tag, body) for tag, body in blocks if tag != "note"]
+    if not codes and not note:
+        return
+    if Gui.info(f"提示：{note}\n将运行的代码:\n{''.join(body for _, body in codes)}") != QMessageBox.Ok:
+        logging.info("取消操作")
+        return
+    for tag, body in codes:
+        run_code(tag, body, ctx)
+
+def show_answer(answer):
+    logging.info(f"answer:{answer}")
+    Gui.info(answer, buttons=QMessageBox.Ok)
+
+def show_ambiguous(text):
+    logging.info(f"ambiguous input")
+    Gui.info(f"输入不明确：{text}", buttons=QMessageBox.Yes)
+
+def response_handler(ctx=None):
+    reponse = ctx.response if ctx else Globals.reponse
+    text = ctx.text if ctx else Globals.text
+    if not reponse:
+        return
+
+    pycode, pscode, note = "", "", ""
+
+    with Tracing.span("parse", parent=ctx.trace if ctx else None):
+        if "```python" in reponse:
+            pycode = reponse.split("```python")[1].split("```")[0].strip()
+
+        if "```powershell" in reponse:
+            pscode = reponse.split("```powershell")[1].split("```")[0].strip()
+
+        if "```note" in reponse:
+            note = reponse.split("```note")[1].split("```")[0].strip()
+
+    if pycode or pscode or note:
+        if note or Globals.always_ask:
+            if Gui.info(f"提示：{note}\n将运行的代码:\n{pscode+pycode}") != QMessageBox.Ok:
+                logging.info("取消操作")
+                return
+
+        if pycode != "":
+            run_code("python", pycode, ctx)
+
+        if pscode != "":
+            run_code("powershell", pscode, ctx)
+
+    if "```answer" in reponse:
+        answer = reponse.split("```answer")[1].split("```")[0].strip()
+        show_answer(answer)
+
+    if "```ambiguous```" in reponse:
+        show_ambiguous(text)
+Globals.reponse_handler = response_handler
+
+
+def hotkey_pressed_handler():
+    if Globals.speech_service is None:
+        logging.info("语音服务尚未就绪")
+        return
+    if not Globals.is_recording:
+        Globals.pipeline.cancel_current("新的语音输入")
+        threading.Thread(target=Globals.speech_service.start_recording).start()
+        logging.info("录音开始...")
+        Gui.run_in_main_thread(Globals.controller.create_window)
+        Globals.is_recording = True
+
+
+def hotkey_released_handler(event):
+    """按键松开时，开始识别"""
+    if Globals.is_recording and event.name == Globals.hotkey:
+        recognize_handler()
+
+    keyboard.release(Globals.hotkey)
+
+
+def recognize_handler():
+    """结束录音,在流水线中完成识别和处理并立即返回"""
+    Globals.is_recording = False
+    ctx = Pipeline.RequestContext("voice")
+    # 立即停止录音,不等待会话队列中的其他请求
+    ctx.audio, time_last = Globals.speech_service.stop_recording()
+    logging.info(f"录音结束，时长:{time_last:.2f}s")
+    # 从按下快捷键开始计时
+    press_time = Globals.speech_service.stime
+    if press_time is not None and press_time < ctx.trace.start:
+        ctx.trace.start = press_time
+        ctx.trace.child("hotkey", press_time).finish(ctx.created)
+    # 录音检查和识别不依赖对话历史,立即执行,请求在会话队列中的位置在此时确定
+    Globals.pipeline.submit(
+        ctx,
+        [("llm", llm_stage), ("execute", execute_stage)],
+        supersede=True,
+        before=[("capture", capture_stage), ("asr", asr_stage)],
+    )
+
+
+def hands_free_start_handler():
+    """免按键模式下检测到说话开始"""
+    Globals.pipeline.cancel_current("新的语音输入")
+    logging.info("检测到语音,录音开始...")
+    Gui.run_in_main_thread(Globals.controller.create_window)
+    Globals.is_recording = True
+
+
+def hands_free_end_handler():
+    """免按键模式下检测到说话结束"""
+    recognize_handler()
+
+
+def modules_dir():
+    #判断是否在打包环境中
+    if getattr(sys, 'frozen', False):
+        return "_internal/modules"
+    return "modules"
+
+
+def register_module(module_name, functions, extra, catalog):
+    """注册一个模块的函数(可能是按清单生成的占位函数)和附加文本"""
+    logging.info(f"加载模块:{module_name}")
+    for function in functions:
+        sig = inspect.signature(function)
+        logging.info(f"-注册函数:{module_name}.{function.__name__}{sig}")
+        globals()[function.__name__] = function
+        Globals.router.register(function)
+        catalog.add_function(function)
+    catalog.add_extra(extra, f"modules.{module_name}")
+
+
+def unregister_module(module_name, catalog):
+    """移除模块注册的函数、触发短语和目录条目"""
+    full_name = f"modules.{module_name}"
+    for name, value in list(globals().items()):
+        if callable(value) and getattr(value, "__module__", None) == full_name:
+            del globals()[name]
+    Globals.router.remove_module(full_name)
+    catalog.remove_module(full_name)
+
+
+def register_function(config):
+    """注册所有模块中的函数,返回函数目录"""
+    catalog = FunctionCatalog.FunctionCatalog(config)  # 生成提示语
+    Globals.plugins = PluginLoader.PluginLoader(config, modules_dir())
+    for module_name, (functions, extra) in Globals.plugins.load_all().items():
+        register_module(module_name, functions, extra, catalog)
+    return catalog
+
+
+def prompts_changed(path):
+    LLMService.reload_prompts()
+
+
+def config_changed(path):
+    """config.json被外部修改时重新加载,与内存中的配置相同(如自动保存)则忽略"""
+    config = json.load(open(path, encoding="utf-8"))
+    if config == Globals.config:
+        return
+
+    def apply():
+        ConfigStore.merge(config)
+        Globals.always_ask = Globals.config["always_ask"]
+        logging.info("配置文件已重新加载")
+        LLMService.reload_prompts()
+
+    Gui.run_in_main_thread(apply)
+
+
+def module_changed(path):
+    """modules目录下的文件新增、修改或删除时重新注册该模块"""
+    module_name = os.path.basename(path)[:-3]
+
+    def reload():
+        unregister_module(module_name, LLMService.catalog)
+        if os.path.exists(path):
+            functions, extra = Globals.plugins.reload(module_name)
+            register_module(module_name, functions, extra, LLMService.catalog)
+        else:
+            logging.info(f"模块已移除:{module_name}")
+        LLMService.reload_prompts()
+        Globals.executor.reload(Globals.plugins.specs())
+
+    # 模块的init可能创建窗口,需在主线程执行
+    Gui.run_in_main_thread(reload)
+
+
+def plugin_refreshed(module_name, functions, extra):
+    """后台初始化的模块附加文本与清单不同时,替换启动时注册的条目"""
+    def apply():
+        unregister_module(module_name, LLMService.catalog)
+        register_module(module_name, functions, extra, LLMService.catalog)
+        LLMService.reload_prompts()
+
+    Gui.run_in_main_thread(apply)
+
+
+def init_speech():
+    """在后台加载语音服务,numpy、sounddevice和百度SDK的导入不阻塞托盘显示"""
+    stime = time.perf_counter()
+    import SpeechService
+
+    Globals.speech_service = SpeechService.init(
+        Globals.config["speech_services"], Globals.config.get("asr_pool")
+    )
+    if Globals.speech_service.hands_free:
+        Globals.speech_service.start_hands_free(
+            hands_free_start_handler, hands_free_end_handler
+        )
+    logging.info(f"启动耗时:语音服务(后台){(time.perf_counter() - stime) * 1000:.0f}ms")
+
+
+def phase(name):
+    """记录启动阶段的耗时"""
+    global phase_time
+    now = time.perf_counter()
+    startup_phases.append((name, now - phase_time))
+    phase_time = now
+
+
+def on_ready():
+    """托盘显示后输出启动耗时报告,并在后台刷新依赖外部环境的模块"""
+    phase("托盘")
+    report = ", ".join(f"{name}{cost * 1000:.0f}ms" for name, cost in startup_phases)
+    logging.info(f"启动耗时:{report},共{(phase_time - start_time) * 1000:.0f}ms")
+    Globals.plugins.refresh(plugin_refreshed)
+
+
+def main():
+    phase("导入")
+    # 加载配置
+    Globals.config = ConfigStore.init("config.json")
+    Globals.always_ask = Globals.config["always_ask"]
+    Globals.hotkey = Globals.config["hotkey"]
+    Globals.icon = Globals.config["icon"]
+
+    # 初始化日志
+    init_logger()
+    Tracing.init(Globals.config)
+    phase("配置")
+
+    # 初始化请求流水线
+    Globals.pipeline = Pipeline.Pipeline(Globals.config, on_finish=pipeline_finished)
+
+    # 注册模块函数并初始化LLM服务
+    Globals.router = IntentRouter.IntentRouter(Globals.config)
+    catalog = register_function(Globals.config)
+    phase("模块")
+    LLMService.init(Globals.config, catalog)
+    phase("LLM")
+
+    # 在后台预热代码执行进程
+    Globals.executor = Executor.Executor(Globals.config, Globals.plugins.specs(), call_in_main)
+
+    # 初始化语音服务
+    threading.Thread(target=init_speech, daemon=True).start()
+
+    # 监视提示词、配置和模块文件,变化时热重载
+    Globals.watcher = FileWatcher.FileWatcher(**Globals.config.get("watch", {}))
+    Globals.watcher.watch(Globals.config["system"], prompts_changed)
+    Globals.watcher.watch("config.json", config_changed)
+    Globals.watcher.watch(modules_dir(), module_changed)
+    Globals.watcher.start()
+
+    # 注册快捷键
+    keyboard.add_hotkey(Globals.hotkey, hotkey_pressed_handler)
+    keyboard.on_release(hotkey_released_handler)
+    phase("监视与快捷键")
+
+    # 启动事件循环,退出前保存未写入的配置和响应缓存
+    code = Gui.run_QtApp(on_ready)
+    ConfigStore.flush()
+    LLMService.cache.flush()
+    Globals.executor.close()
+    LogPipeline.stop()
+    sys.exit(code)
+
+if __name__ == "__main__":
+    # 打包后执行进程以spawn方式启动,需要freeze_support
+    multiprocessing.freeze_support()
+    main()
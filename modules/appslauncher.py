@@ -1,45 +1,98 @@
-import os
-import glob
-import logging
-
-short_cuts = ""
-
-def get_desktop_shortcuts():
-    # 获取用户桌面路径
-    user_desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-    # 获取公共桌面路径
-    public_desktop_path = os.path.join(
-        os.environ.get("PUBLIC", "C:\\Users\\Public"), "Desktop"
-    )
-
-    user_shortcuts = glob.glob(os.path.join(user_desktop_path, "*.lnk")) + glob.glob(
-        os.path.join(user_desktop_path, "*.url")
-    )
-    public_shortcuts = glob.glob(
-        os.path.join(public_desktop_path, "*.lnk")
-    ) + glob.glob(os.path.join(public_desktop_path, "*.url"))
-
-    return user_shortcuts + public_shortcuts
-
-
-def start_program(query):
-    """通过传入的字符串模糊匹配并启动对应程序"""
-    global short_cuts
-    for shortcut in short_cuts:
-        # 获取快捷方式文件名
-        file_name = os.path.basename(shortcut).lower()
-        if query.lower() in file_name:
-            os.startfile(shortcut)
-            logging.info(f"启动程序：{file_name}")
-            return
-    logging.info(f"未找到程序：{query}")
-
-def init(config):
-    global short_cuts
-    programs = ""
-    short_cuts = get_desktop_shortcuts()
-    for shortcut in short_cuts:
-        file_name = os.path.basename(shortcut).lower()[0:-4]
-        programs += f"{file_name}\n"
-
-    return [start_program], "可用的程序列表：\n" + programs
\ No newline at end of file
+import os
+import logging
+import ConfigStore
+from AppIndex import AppIndex, suffixes
+from FileWatcher import FileWatcher
+
+index = None
+config = None
+# 重新加载模块时保留旧的监视器以便停止
+watcher = globals().get("watcher")
+
+# 程序列表来自快捷方式目录,启动后在后台重新扫描
+LAZY = False
+
+default_config = {
+    "start_menu": True,  # 是否索引开始菜单
+    "directories": [],  # 额外索引的目录
+    "max_items": 200,  # 提示词中最多列出的程序数
+    "min_score": 0.6,  # 低于该得分不启动
+    "watch_interval": 5,  # 未安装watchdog时轮询目录的间隔(秒)
+}
+
+
+def get_shortcut_dirs():
+    """返回[(目录, 优先级, 是否递归)],桌面优先"""
+    # 获取用户桌面路径
+    user_desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
+    # 获取公共桌面路径
+    public_desktop_path = os.path.join(
+        os.environ.get("PUBLIC", "C:\\Users\\Public"), "Desktop"
+    )
+    dirs = [(user_desktop_path, 2, False), (public_desktop_path, 2, False)]
+
+    if config["start_menu"]:
+        for root in (os.environ.get("APPDATA"), os.environ.get("PROGRAMDATA")):
+            if root:
+                dirs.append((os.path.join(root, "Microsoft", "Windows", "Start Menu", "Programs"), 1, True))
+    for directory in config["directories"]:
+        dirs.append((os.path.expandvars(os.path.expanduser(directory)), 1, True))
+    return [item for item in dirs if os.path.isdir(item[0])]
+
+
+def on_change(priority):
+    """目录中的快捷方式增删时增量更新索引"""
+    def callback(path):
+        if os.path.exists(path):
+            index.add(path, priority)
+            logging.info(f"程序索引:新增{os.path.basename(path)}")
+        else:
+            index.remove(path)
+            logging.info(f"程序索引:移除{os.path.basename(path)}")
+    return callback
+
+
+def start_program(query):
+    """通过传入的字符串模糊匹配(支持拼音和首字母)并启动对应程序"""
+    query = str(query)
+    results = index.search(query)
+    candidates = ", ".join(f"{entry.name}({score:.2f})" for score, entry in results)
+    if not results or results[0][0] < config["min_score"]:
+        logging.info(f"未找到程序：{query},候选:{candidates or '无'}")
+        return
+    entry = results[0][1]
+    os.startfile(entry.path)
+    logging.info(f"启动程序：{entry.name},候选:{candidates}")
+
+
+def program_score(query):
+    """本地意图匹配时判断query是否为已索引的程序,低于min_score时为0"""
+    results = index.search(str(query), limit=1) if index is not None else []
+    if not results or results[0][0] < config["min_score"]:
+        return 0
+    return results[0][0]
+
+
+# 本地意图匹配用的参数打分,见IntentRouter.slot_scorer
+SLOT_SCORES = {"start_program": {"query": program_score}}
+
+
+def init(_config):
+    global index, watcher, config
+    if "appslauncher" not in _config or default_config.keys() - _config["appslauncher"].keys():
+        _config["appslauncher"] = {**default_config, **_config.get("appslauncher", {})}
+        ConfigStore.mark_dirty("appslauncher")
+    config = _config["appslauncher"]
+
+    if watcher is not None:
+        watcher.stop()
+    index = AppIndex()
+    watcher = FileWatcher(interval=config["watch_interval"])
+    for directory, priority, recursive in get_shortcut_dirs():
+        count = index.scan(directory, priority, recursive)
+        watcher.watch(directory, on_change(priority), suffixes, recursive)
+        logging.info(f"程序索引:{directory}共{count}个")
+    watcher.start()
+
+    programs = "".join(f"{name}\n" for name in index.names(config["max_items"]))
+    return [start_program], "可用的程序列表(start_program支持模糊和拼音匹配)：\n" + programs
@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    """各模块按相对路径读取config.json、prompts.txt和cache/"""
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,36 @@
+import numpy as np
+from AudioBuffer import RingBuffer, as_bytes
+
+
+def samples(start, count):
+    return np.arange(start, start + count, dtype=np.int16).reshape(-1, 1)
+
+
+def test_view_is_contiguous_across_wraparound():
+    ring = RingBuffer(max_seconds=1, sample_rate=10)  # 容量10个样本
+    ring.write(samples(0, 7))
+    ring.write(samples(7, 7))
+    assert ring.overflowed
+    view = ring.view()
+    assert view.flags["C_CONTIGUOUS"]
+    assert view[:, 0].tolist() == list(range(4, 14))
+    assert np.shares_memory(view, ring.data)
+
+
+def test_block_larger_than_capacity_keeps_tail():
+    ring = RingBuffer(max_seconds=1, sample_rate=10)
+    ring.write(samples(0, 25))
+    assert ring.write_pos == 25
+    assert ring.view()[:, 0].tolist() == list(range(15, 25))
+
+
+def test_reset_with_preroll_and_partial_view():
+    ring = RingBuffer(max_seconds=1, sample_rate=10)
+    ring.write(samples(0, 8))
+    ring.reset(preroll=3)
+    assert len(ring) == 3
+    ring.write(samples(8, 4))
+    assert ring.view()[:, 0].tolist() == list(range(5, 12))
+    assert ring.view(10)[:, 0].tolist() == [10, 11]
+    assert not ring.overflowed
+    assert bytes(as_bytes(ring.view(10))) == samples(10, 2).tobytes()
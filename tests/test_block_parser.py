@@ -0,0 +1,37 @@
+import sys
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("LLMService使用Python 3.12的f-string语法", allow_module_level=True)
+
+from LLMService import BlockParser
+
+response = "好的\n```note\n将打开连点\n```\n```python\nstart_autoclick()\n```\n```powershell\nGet-Date\n```"
+expected = [("note", "将打开连点"), ("python", "start_autoclick()"), ("powershell", "Get-Date")]
+
+
+def parse(chunks):
+    parser = BlockParser()
+    blocks = []
+    for chunk in chunks:
+        blocks.extend(parser.feed(chunk))
+    return blocks
+
+
+def test_whole_response():
+    assert parse([response]) == expected
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 7])
+def test_fences_split_across_chunks(size):
+    chunks = [response[i:i + size] for i in range(0, len(response), size)]
+    assert parse(chunks) == expected
+
+
+def test_blocks_close_as_soon_as_fence_arrives():
+    parser = BlockParser()
+    assert parser.feed("```pyt") == []
+    assert parser.feed("hon\nstart_autoclick()\n``") == []
+    assert parser.feed("`") == [("python", "start_autoclick()")]
+    assert parser.feed("\n```answer\n") == []
+
@@ -0,0 +1,47 @@
+import time
+from ClickScheduler import ClickScheduler, RecordingBackend
+
+
+def run(scheduler, seconds):
+    scheduler.start()
+    scheduler.set_active("left", True)
+    time.sleep(seconds)
+    scheduler.set_active("left", False)
+    time.sleep(0.05)
+    scheduler.stop()
+
+
+def test_deadlines_do_not_drift():
+    backend = RecordingBackend()
+    scheduler = ClickScheduler(backend, {"interval": 0.005})
+    run(scheduler, 0.5)
+    times = [t for t, _ in backend.clicks]
+    mean = (times[-1] - times[0]) / (len(times) - 1)
+    # sleep误差不累积,平均间隔应接近目标
+    assert abs(mean - 0.005) < 0.0015
+    assert all(button == "left" for _, button in backend.clicks)
+
+
+class StallingBackend(RecordingBackend):
+    """第stall_at次点击时卡顿stall秒"""
+
+    def __init__(self, stall_at, stall):
+        super().__init__()
+        self.stall_at = stall_at
+        self.stall = stall
+
+    def click(self, button):
+        super().click(button)
+        if len(self.clicks) == self.stall_at:
+            time.sleep(self.stall)
+
+
+def test_max_lag_skips_instead_of_bursting():
+    backend = StallingBackend(stall_at=10, stall=0.2)
+    scheduler = ClickScheduler(backend, {"interval": 0.01, "max_lag": 0.05})
+    run(scheduler, 0.5)
+    assert scheduler.stats.skipped > 0
+    times = [t for t, _ in backend.clicks]
+    after = [b - a for a, b in zip(times[10:], times[11:])]
+    # 卡顿后从当前时刻重新计时,不会连续补点
+    assert min(after) > 0.005
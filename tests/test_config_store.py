@@ -0,0 +1,50 @@
+import os
+import json
+import time
+from ConfigStore import ConfigStore
+
+
+def make_store(tmp_path, debounce=0.1):
+    path = str(tmp_path / "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"config_store": {"debounce": debounce}, "autoclick": {"interval": 3}, "url": "a"}, f)
+    return ConfigStore(path), path
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_debounce(tmp_path, monkeypatch):
+    store, path = make_store(tmp_path)
+    writes = []
+    replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: (writes.append(dst), replace(src, dst)))
+    for interval in (4, 5, 6):
+        store.update("autoclick", {"interval": interval})
+    assert read(path)["autoclick"]["interval"] == 3
+    time.sleep(0.3)
+    assert writes == [path]
+    assert read(path)["autoclick"]["interval"] == 6
+
+
+def test_unchanged_values_not_marked(tmp_path):
+    store, _ = make_store(tmp_path)
+    assert store.update("autoclick", {"interval": 3}) == {}
+    assert not store.dirty
+
+
+def test_atomic_write_keeps_external_changes(tmp_path):
+    store, path = make_store(tmp_path, debounce=60)
+    store.update("autoclick", {"interval": 5})
+    data = read(path)
+    data["url"] = "b"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    store.flush()
+    data = read(path)
+    assert data["autoclick"]["interval"] == 5
+    assert data["url"] == "b"
+    assert not os.path.exists(path + ".tmp")
+    assert store.timer is None
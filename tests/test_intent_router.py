@@ -0,0 +1,81 @@
+import pytest
+import IntentRouter
+
+
+def start_autoclick():
+    """打开连点"""
+
+
+def start_crosshair():
+    """打开准星"""
+
+
+def set_interval(interval: float):
+    pass
+
+
+def start_program(query):
+    pass
+
+
+# IntentRouter按函数所在模块的SLOT_SCORES为字符串参数打分
+SLOT_SCORES = {"start_program": {"query": lambda query: 1.0 if query == "记事本" else 0}}
+
+
+@pytest.fixture
+def router():
+    config = {
+        "intent": {
+            "triggers": {
+                "set_interval": ["设置连点间隔为{interval}秒"],
+                "start_program": ["打开{query}"],
+            }
+        }
+    }
+    router = IntentRouter.IntentRouter(config)
+    for function in (start_autoclick, start_crosshair, set_interval, start_program):
+        router.register(function)
+    return router
+
+
+@pytest.mark.parametrize("text, code", [
+    ("打开连点", "start_autoclick()"),
+    ("打开准星。", "start_crosshair()"),
+    ("设置连点间隔为0.5秒", "set_interval(interval=0.5)"),
+    ("设置连点间隔为３秒", "set_interval(interval=3.0)"),
+    ("打开记事本", "start_program(query='记事本')"),
+])
+def test_match(router, text, code):
+    assert router.match(text) == code
+
+
+def test_homophone(router):
+    pytest.importorskip("pypinyin")
+    assert router.match("打开连店") == "start_autoclick()"
+
+
+@pytest.mark.parametrize("text", [
+    "设置连点间隔为abc秒",
+    "设置连点间隔为inf秒",
+    "设置连点间隔为nan秒",
+    "打开蓝牙",  # 打分函数不认识的程序
+])
+def test_reject_invalid_slot(router, text):
+    assert router.match(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "别打开连点",
+    "不要打开连点",
+    "不打开准星",
+    "没打开连点",
+    "打开准星吗",
+    "打开准星呢",
+    "打开准星?",
+    "打开准星？",
+    "打开准星了",
+    "快打开连点",
+    "打开连点然后关闭准星",
+])
+def test_reject_negation_question_and_extra_text(router, text):
+    assert router.match(text) is None
@@ -0,0 +1,18 @@
+import pytest
+from MockServer import ws_accept, RealtimeASRServer
+
+
+def test_ws_accept_rfc6455_example():
+    assert ws_accept("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+
+def test_websocket_client_handshake():
+    websocket = pytest.importorskip("websocket")
+    server = RealtimeASRServer(("127.0.0.1", 0))
+    url = server.start()
+    try:
+        ws = websocket.create_connection(url, timeout=3)
+        ws.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,41 @@
+import time
+import Pipeline
+
+
+def make_pipeline():
+    return Pipeline.Pipeline({"sessions": {"voice": "main", "cli": "main"}})
+
+
+def test_voice_keeps_its_place_while_recognizing():
+    pipeline = make_pipeline()
+    order = []
+
+    def asr(ctx):
+        time.sleep(0.2)
+        ctx.text = "打开连点"
+
+    def llm(ctx):
+        order.append(ctx.text)
+
+    voice = Pipeline.RequestContext("voice")
+    pipeline.submit(voice, [("llm", llm)], before=[("asr", asr)])
+    cli = Pipeline.RequestContext("cli", "关闭连点")
+    pipeline.submit(cli, [("llm", llm)])
+    assert cli.finished.wait(2) and voice.finished.wait(2)
+    assert order == ["打开连点", "关闭连点"]
+
+
+def test_failed_recognition_releases_the_queue():
+    pipeline = make_pipeline()
+    order = []
+
+    def asr(ctx):
+        raise RuntimeError("识别失败")
+
+    voice = Pipeline.RequestContext("voice")
+    pipeline.submit(voice, [("llm", lambda ctx: order.append("voice"))], before=[("asr", asr)])
+    cli = Pipeline.RequestContext("cli", "关闭连点")
+    pipeline.submit(cli, [("llm", lambda ctx: order.append("cli"))])
+    assert cli.finished.wait(2) and voice.finished.wait(2)
+    assert order == ["cli"]
+    assert voice.stage == "asr"
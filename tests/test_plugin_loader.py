@@ -0,0 +1,35 @@
+import inspect
+import PluginLoader
+from IntentRouter import param_type
+
+
+def set_interval(interval: float = 0.003, *buttons: str, button: str = "left", **options) -> str:
+    """设置连点间隔"""
+    return f"{interval}:{button}"
+
+
+def make_stub(tmp_path):
+    loader = PluginLoader.PluginLoader({"plugins": {"manifest": str(tmp_path / "plugins.json")}}, str(tmp_path))
+    return loader, loader.stub("autoclick", PluginLoader.describe(set_interval))
+
+
+def test_signature_round_trip(tmp_path):
+    _, stub = make_stub(tmp_path)
+    assert str(inspect.signature(stub)) == str(inspect.signature(set_interval))
+    assert stub.__name__ == "set_interval"
+    assert stub.__doc__ == set_interval.__doc__
+    assert stub.__module__ == "modules.autoclick"
+
+
+def test_param_type(tmp_path):
+    _, stub = make_stub(tmp_path)
+    for name in ("interval", "button"):
+        stub_param = inspect.signature(stub).parameters[name]
+        param = inspect.signature(set_interval).parameters[name]
+        assert param_type(stub_param) == param_type(param)
+
+
+def test_stub_dispatches_to_loaded_function(tmp_path):
+    loader, stub = make_stub(tmp_path)
+    loader.loaded["autoclick"] = ({"set_interval": set_interval}, "")
+    assert stub(0.01, button="right") == "0.01:right"
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import pytest
+import ResponseCache
+from ResponseCache import is_cacheable
+
+code = "```python\nstart_autoclick()\n```"
+
+
+def make_cache(tmp_path, **config):
+    path = str(tmp_path / "responses.json")
+    return ResponseCache.ResponseCache({"cache": {"path": path, "save_delay": 0.05, **config}}), path
+
+
+def test_hit_returns_content_and_model(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    cache.put("打开连点", code, "small")
+    assert cache.get("打开 连点!") == (code, "small")
+    assert cache.get("关闭连点") is None
+
+
+def test_ttl(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, ttl=10)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.put("打开连点", code, "small")
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("打开连点") is None
+    assert not cache.entries
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache, _ = make_cache(tmp_path, max_size=2)
+    cache.put("a", code, "m")
+    cache.put("b", code, "m")
+    assert cache.get("a") is not None  # a变为最近使用
+    cache.put("c", code, "m")
+    assert list(cache.entries) == ["a", "c"]
+
+
+@pytest.mark.parametrize("content, expected", [
+    (code, True),
+    ("```powershell\nGet-Date\n```\n```python\nprint(1)\n```", True),
+    ("```answer\n今天是星期一\n```", False),
+    ("```note\n需要确认\n```\n" + code, False),
+    ("好的," + code, False),
+    ("你好", False),
+])
+def test_only_code_blocks_are_cacheable(content, expected):
+    assert is_cacheable(content) == expected
+
+
+def test_put_skips_uncacheable(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    cache.put("今天星期几", "```answer\n星期一\n```", "small")
+    assert cache.get("今天星期几") is None
+
+
+def test_saved_in_background(tmp_path):
+    cache, path = make_cache(tmp_path)
+    cache.put("打开连点", code, "small")
+    assert not os.path.exists(path)  # put不在调用线程中写文件
+    deadline = time.time() + 2
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["entries"] == [["打开连点", [cache.entries["打开连点"][0], code, "small"]]]
+
+
+def test_flush_and_reload(tmp_path):
+    cache, path = make_cache(tmp_path, save_delay=60)
+    cache.validate("fp")
+    cache.put("打开连点", code, "small")
+    cache.flush()
+    reloaded, _ = make_cache(tmp_path)
+    reloaded.validate("fp")
+    assert reloaded.get("打开连点") == (code, "small")
+    reloaded.validate("other")
+    assert reloaded.get("打开连点") is None
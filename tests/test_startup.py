@@ -0,0 +1,40 @@
+"""启动冒烟测试:未定义的名称只会在后台线程中以NameError出现,启动时不会报错"""
+import os
+import ast
+import glob
+import pytest
+import Globals
+from conftest import ROOT
+
+
+def source_files():
+    files = glob.glob(os.path.join(ROOT, "*.py")) + glob.glob(os.path.join(ROOT, "modules", "*.py"))
+    return sorted(files) + [os.path.join(ROOT, "main.pyw")]
+
+
+@pytest.mark.parametrize("path", source_files(), ids=lambda path: os.path.relpath(path, ROOT))
+def test_no_undefined_names(path):
+    checker = pytest.importorskip("pyflakes.checker")
+    from pyflakes.messages import UndefinedName
+
+    source = open(path, encoding="utf-8").read()
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError:
+        pytest.skip("当前Python版本无法解析该文件")
+    undefined = [str(m) for m in checker.Checker(tree, filename=path).messages if isinstance(m, UndefinedName)]
+    assert not undefined
+
+
+def test_init_speech_sets_service(monkeypatch):
+    pytest.importorskip("PyQt5")
+    pytest.importorskip("keyboard")
+    import Benchmark
+
+    main = Benchmark.load_main()
+    config = {"speech_services": [{"name": "MockASR", "Priority": 1, "delay": 0}], "asr_pool": {}}
+    monkeypatch.setattr(Globals, "config", config)
+    monkeypatch.setattr(Globals, "speech_service", None)
+    main.init_speech()
+    assert Globals.speech_service is not None
+    assert Globals.speech_service.providers[0].name == "MockASR"
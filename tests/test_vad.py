@@ -0,0 +1,49 @@
+import numpy as np
+from VAD import VAD, Endpointer
+
+rate = 16000
+
+
+def signal(silence_before, speech, silence_after, seed=0):
+    """低噪声中夹一段元音般的谐波,单位为秒"""
+    rng = np.random.default_rng(seed)
+    total = int((silence_before + speech + silence_after) * rate)
+    audio = rng.normal(0, 30, total)
+    start, end = int(silence_before * rate), int((silence_before + speech) * rate)
+    t = np.arange(end - start) / rate
+    audio[start:end] += sum(3000 / k * np.sin(2 * np.pi * 200 * k * t) for k in range(1, 4))
+    return audio.astype(np.int16).reshape(-1, 1), start, end
+
+
+def test_endpointer_reports_start_and_end():
+    vad = VAD({}, rate)
+    endpointer = Endpointer(vad)
+    audio, start, end = signal(1.0, 0.6, 1.5)
+    events = []
+    chunk = vad.frame_len * 5
+    for pos in range(0, len(audio) - chunk + 1, chunk):
+        events.extend(endpointer.process(audio[pos:pos + chunk, 0]))
+    assert [name for name, _ in events] == ["start", "end"]
+    pad = vad.config["pad_ms"] * rate // 1000
+    # 开始位置包含前置余量,在语音开始前pad_ms左右
+    assert abs(events[0][1] - (start - pad)) <= vad.frame_len * (vad.min_frames + 1)
+    # 结束在语音结束后静音end_silence_ms时报告
+    silence = vad.config["end_silence_ms"] * rate // 1000
+    assert abs(events[1][1] - (end + silence)) <= vad.frame_len * 2
+
+
+def test_endpointer_ignores_short_clicks():
+    vad = VAD({}, rate)
+    endpointer = Endpointer(vad)
+    audio, _, _ = signal(0.5, 0.04, 0.5)  # 短于min_speech_ms
+    assert endpointer.process(audio[: len(audio) // vad.frame_len * vad.frame_len, 0]) == []
+
+
+def test_trim_returns_view_or_none():
+    vad = VAD({}, rate)
+    audio, start, end = signal(0.5, 0.5, 0.5)
+    trimmed = vad.trim(audio)
+    assert np.shares_memory(trimmed, audio)
+    assert len(trimmed) < len(audio)
+    quiet, _, _ = signal(1.0, 0, 0)
+    assert vad.trim(quiet) is None